@@ -1,6 +1,6 @@
 import pathlib
-import tomli
+import tomllib
 
 path = pathlib.Path(__file__).parent / "config.toml"
 with path.open(mode="rb") as fp:
-    config = tomli.load(fp)
\ No newline at end of file
+    config = tomllib.load(fp)
\ No newline at end of file
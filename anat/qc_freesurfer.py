@@ -1,4 +1,5 @@
 import json
+import logging
 import os
 import pandas as pd
 from pathlib import Path
@@ -11,6 +12,8 @@ import re
 import csv
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 
 def read_log(log_file):
     """
@@ -214,8 +217,7 @@ def compute_metrics(config, subjects_sessions):
         output_dir = f"{DERIVATIVES_DIR}/freesurfer/outputs/{sub_sess}"
         log_file = f"{output_dir}/scripts/recon-all.log"
         info = read_log(log_file)
-        dir_count = utils.count_dirs(output_dir)
-        file_count = utils.count_files(output_dir)
+        dir_count, file_count = utils.count_tree(output_dir)
         frames.append([sub_sess, dir_count, file_count] + list(info))
     logs = pd.DataFrame(frames, columns=cols)
     fsqc_results = pd.read_csv(f"{DERIVATIVES_DIR}/qc/freesurfer/outputs/fsqc-results.csv")
@@ -320,8 +322,7 @@ def generate_bash_script(config, subjects_sessions, path_to_script):
     ownership_sharing = f'\nchmod -Rf 771 {DERIVATIVES_DIR}/qc/freesurfer\n'
 
     # Write the complete BASH script to the specified file
-    with open(path_to_script, 'w') as f:
-        f.write(module_export + singularity_command + python_command + ownership_sharing)
+    utils.write_script(path_to_script, module_export, singularity_command, python_command, ownership_sharing)
 
 
 def run(config, job_ids=None):
@@ -335,11 +336,13 @@ def run(config, job_ids=None):
     DERIVATIVES_DIR = common["derivatives"]
 
     # Create output (derivatives) directories
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/freesurfer", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/freesurfer/outputs", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/freesurfer/stdout", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/freesurfer/scripts", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/freesurfer/outliers", exist_ok=True)
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/qc/freesurfer",
+        f"{DERIVATIVES_DIR}/qc/freesurfer/outputs",
+        f"{DERIVATIVES_DIR}/qc/freesurfer/stdout",
+        f"{DERIVATIVES_DIR}/qc/freesurfer/scripts",
+        f"{DERIVATIVES_DIR}/qc/freesurfer/outliers",
+    )
 
     # List all subjects and sessions in FreeSurfer BIDS output directory
     subjects_sessions = utils.get_subjects(f"{DERIVATIVES_DIR}/freesurfer/outputs")
@@ -360,7 +363,7 @@ def run(config, job_ids=None):
     cmd += f'sh {path_to_script} &'
 
     os.system(cmd)
-    print(f"[QC-FREESURFER] Submitting (background) task on interactive node")
+    logger.info("[QC-FREESURFER] Submitting (background) task on interactive node")
     return
 
 
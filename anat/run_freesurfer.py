@@ -1,10 +1,12 @@
+import logging
 import os
-import shutil
 from pathlib import Path
 import sys
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 import utils
 
+logger = logging.getLogger(__name__)
+
 
 def check_prerequisites(config, subject, session):
     """
@@ -40,7 +42,7 @@ def check_prerequisites(config, subject, session):
         )
     for file in required_files:
         if not os.path.exists(file):
-            print(f"[FREESURFER] ERROR - Missing file: {file}")
+            logger.error("[FREESURFER] ERROR - Missing file: %s", file)
             return False
     return True
 
@@ -63,12 +65,12 @@ def is_already_processed(config, subject, session, clear_fs=False):
 
     # Remove existing subject folder
     if clear_fs:
-        shutil.rmtree(output_dir)
+        utils.remove_dir(output_dir)
 
     return False
 
 
-def generate_slurm_script(config, subject, session, path_to_script):
+def generate_slurm_script(config, subject, session, path_to_script, job_ids=None):
     """
     Generate the SLURM script for FreeSurfer processing.
 
@@ -82,6 +84,8 @@ def generate_slurm_script(config, subject, session, path_to_script):
         Session identifier.
     path_to_script : str
         Path where the SLURM script will be saved.
+    job_ids : list, optional
+        List of SLURM job IDs to set as dependencies (default is None).
     """
 
     common = config["common"]
@@ -100,6 +104,8 @@ def generate_slurm_script(config, subject, session, path_to_script):
         f'#SBATCH -o {DERIVATIVES_DIR}/freesurfer/stdout/%x_job-%j.out\n'
     )
 
+    header += utils.dependency_directive(job_ids)
+
     if common.get("email"):
         header += (
             f'#SBATCH --mail-type={common["email_frequency"]}\n'
@@ -109,12 +115,8 @@ def generate_slurm_script(config, subject, session, path_to_script):
     if common.get("account"):
         header += f'#SBATCH --account={common["account"]}\n'
 
-    module_export = (
-        f'\nmodule purge\n'
-        f'module load userspace/all\n'
-        f'module load singularity\n'
-        # f'export SUBJECTS_DIR={BIDS_DIR}\n'
-    )
+    module_export = utils.MODULE_EXPORT
+    # module_export += f'export SUBJECTS_DIR={BIDS_DIR}\n'
 
     singularity_command = (
         f'\napptainer run \\\n'
@@ -146,11 +148,10 @@ def generate_slurm_script(config, subject, session, path_to_script):
     ownership_sharing = f'\nchmod -Rf 771 {DERIVATIVES_DIR}/freesurfer\n'
 
     # Write the complete SLURM script to the specified file
-    with open(path_to_script, 'w') as f:
-        f.write(header + module_export + singularity_command + ownership_sharing)
+    utils.write_script(path_to_script, header, module_export, singularity_command, ownership_sharing)
 
 
-def run_freesurfer(config, subject, session):
+def run_freesurfer(config, subject, session, job_ids=None):
     """
     Run the FreeSurfer processing for a given subject and session.
 
@@ -162,6 +163,8 @@ def run_freesurfer(config, subject, session):
         Subject identifier.
     session : str
         Session identifier.
+    job_ids : list, optional
+        List of SLURM job IDs to set as dependencies (default is None).
 
     Returns
     -------
@@ -174,19 +177,28 @@ def run_freesurfer(config, subject, session):
     if not check_prerequisites(config, subject, session):
         return None
 
+    # Do not submit twice a job still in the queue, downstream steps wait for the queued one.
+    # Checked first: a running recon-all has no 'finished' status yet and its folder would be cleared
+    job_id = utils.get_active_job(f"freesurfer_{subject}_{session}")
+    if job_id:
+        logger.info("[FREESURFER] Job %s already queued for %s - %s", job_id, subject, session)
+        return job_id
+
     if is_already_processed(config, subject, session, clear_fs=True) and freesurfer["skip_processed"]:
-        print(f"[FREESURFER] Skip already processed {subject} - {session}")
+        logger.info("[FREESURFER] Skip already processed %s - %s", subject, session)
         return None
 
     # Create output (derivatives) directories
-    os.makedirs(f"{DERIVATIVES_DIR}/freesurfer", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/freesurfer/stdout", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/freesurfer/scripts", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/freesurfer/outputs", exist_ok=True)
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/freesurfer",
+        f"{DERIVATIVES_DIR}/freesurfer/stdout",
+        f"{DERIVATIVES_DIR}/freesurfer/scripts",
+        f"{DERIVATIVES_DIR}/freesurfer/outputs",
+    )
 
     path_to_script = f"{DERIVATIVES_DIR}/freesurfer/scripts/{subject}_{session}_freesurfer.slurm"
-    generate_slurm_script(config, subject, session, path_to_script)
+    generate_slurm_script(config, subject, session, path_to_script, job_ids=job_ids)
 
-    cmd = f"sbatch {path_to_script}"
+    cmd = ["sbatch", path_to_script]
     job_id = utils.submit_job(cmd)
     return job_id
@@ -1,5 +1,5 @@
 import json
-import os
+import logging
 import sys
 from pathlib import Path
 import pandas as pd
@@ -10,6 +10,8 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 import utils
 from dwi.qc_qsiprep_metrics_extractions import run as extract_qc_metrics
 
+logger = logging.getLogger(__name__)
+
 
 def generate_slurm_script(config, subject, session, path_to_script, job_ids=None):
     """
@@ -43,8 +45,7 @@ def generate_slurm_script(config, subject, session, path_to_script, job_ids=None
         f'#SBATCH --partition={mriqc["partition"]}\n'
     )
 
-    if job_ids:
-        header += f'#SBATCH --dependency=afterok:{":".join(job_ids)}\n'
+    header += utils.dependency_directive(job_ids)
 
     if common.get("email"):
         header += (
@@ -116,8 +117,7 @@ def generate_slurm_script(config, subject, session, path_to_script, job_ids=None
     ownership_sharing = f'\nchmod -Rf 771 {DERIVATIVES_DIR}/qc/qsiprep\n'
 
     # Write the complete SLURM script to the specified file
-    with open(path_to_script, 'w') as f:
-        f.write(header + module_export + prereq_check + singularity_command + python_command + ownership_sharing)
+    utils.write_script(path_to_script, header, module_export, prereq_check, singularity_command, python_command, ownership_sharing)
 
 
 def run(config, subject, session, job_ids=None):
@@ -125,29 +125,36 @@ def run(config, subject, session, job_ids=None):
     common = config["common"]
     DERIVATIVES_DIR = common["derivatives"]
 
+    # Nothing to check if QSIprep was neither submitted in this run nor run before
+    if not job_ids and not utils.is_already_processed(config, "qsiprep", subject, session):
+        logger.warning("[QC-QSIPREP] QSIprep did not terminate for %s %s. Please run QSIprep command before QC.", subject, session)
+        return None
+
     # Create output (derivatives) directories
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/qsiprep", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/qsiprep/outputs", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/qsiprep/stdout", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/qsiprep/scripts", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/qsiprep/work", exist_ok=True)
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/qc/qsiprep",
+        f"{DERIVATIVES_DIR}/qc/qsiprep/outputs",
+        f"{DERIVATIVES_DIR}/qc/qsiprep/stdout",
+        f"{DERIVATIVES_DIR}/qc/qsiprep/scripts",
+        f"{DERIVATIVES_DIR}/qc/qsiprep/work",
+    )
 
     if not utils.is_mriqc_done(config, subject, session, runtype='qsiprep'):
         path_to_script = f"{DERIVATIVES_DIR}/qc/qsiprep/scripts/qc_qsiprep_{subject}_{session}.slurm"
         generate_slurm_script(config, subject, session, path_to_script, job_ids=job_ids)
-        cmd = f"sbatch {path_to_script}"
-        print(f"[QC-QSIPREP] Submitting job: {cmd}")
+        cmd = ["sbatch", path_to_script]
+        logger.info("[QC-QSIPREP] Submitting job: %s", " ".join(cmd))
         job_id = utils.submit_job(cmd)
         return job_id
 
     else:
-        print(f"[QC-QSIPREP] Skip already processed MRIQC")
-        print(f"[QC-QSIPREP] Performing only python command extraction for {subject}_{session}")
+        logger.info("[QC-QSIPREP] Skip already processed MRIQC")
+        logger.info("[QC-QSIPREP] Performing only python command extraction for %s_%s", subject, session)
         try:
             # todo: should be ran in interactive mode...
             extract_qc_metrics(config, subject, session)
         except Exception as e:
-            print(f"[QC-QSIPREP] ERROR during QC extraction: {e}", file=sys.stderr)
+            logger.error("[QC-QSIPREP] ERROR during QC extraction: %s", e)
             raise
 
     # # version interactive
@@ -211,5 +218,5 @@ def run_group_qc(config, job_ids=None):
     # Run group-level MRIQC
     run_mriqc_group(config, f"{DERIVATIVES_DIR}/qsiprep/outputs", data_type="qsiprep", job_ids=job_ids)
 
-    print(f"[QC-QSIPREP] Group-level QC saved in {DERIVATIVES_DIR}/qc/qsiprep\n")
+    logger.info("[QC-QSIPREP] Group-level QC saved in %s/qc/qsiprep\n", DERIVATIVES_DIR)
 
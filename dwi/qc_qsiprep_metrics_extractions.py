@@ -34,8 +34,7 @@ def run(config, subject, session):
     try:
         # Extract process status from log files
         finished_status, runtime = utils.read_log(config, subject, session, runtype="qsiprep")
-        dir_count = utils.count_dirs(output_dir)
-        file_count = utils.count_files(output_dir)
+        dir_count, file_count = utils.count_tree(output_dir)
 
         # Load TSV file produced by QSIprep
         qsiprep_metrics = f'{subject}_{session}_run-01_desc-confounds_timeseries.tsv'
@@ -75,7 +74,7 @@ def run(config, subject, session):
         t1w_brain = t1w_data * t1w_mask_data
         dwi_brain = dwi_data * dwi_mask_data
         dwi_brain_hr = utils.resample(dwi_brain, t1w_data)
-        dwi_mask_data_hr = utils.resample(dwi_mask_data, t1w_data)
+        dwi_mask_data_hr = utils.resample(dwi_mask_data, t1w_data, order=0)
 
         # Compute QC metrics
         row = dict(
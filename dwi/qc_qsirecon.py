@@ -1,10 +1,13 @@
-import os
+import logging
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
+import utils
 from dwi.qc_qsirecon_metrics_extractions import run as extract_qc_metrics
 from dwi.run_qsirecon import is_already_processed as is_qsirecon_done
 
+logger = logging.getLogger(__name__)
+
 
 def run(config, subject, session, job_ids=None):
 
@@ -12,17 +15,19 @@ def run(config, subject, session, job_ids=None):
     DERIVATIVES_DIR = common["derivatives"]
 
     # Create output (derivatives) directories
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/qsirecon", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/qsirecon/outputs", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/qsirecon/stdout", exist_ok=True)
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/qc/qsirecon",
+        f"{DERIVATIVES_DIR}/qc/qsirecon/outputs",
+        f"{DERIVATIVES_DIR}/qc/qsirecon/stdout",
+    )
 
     if not is_qsirecon_done(config, subject, session):
-        print(f"[QC-QSIRECON] QSIrecon did not terminate for {subject} {session}. Please run QSIrecon command before QC.")
+        logger.warning("[QC-QSIRECON] QSIrecon did not terminate for %s %s. Please run QSIrecon command before QC.", subject, session)
         return None
 
-    print(f"[QC-QSIRECON] Performing QC metric extraction for {subject} {session}")
+    logger.info("[QC-QSIRECON] Performing QC metric extraction for %s %s", subject, session)
     try:
         extract_qc_metrics(config, subject, session)
     except Exception as e:
-        print(f"[QC-QSIRECON] ERROR during QC extraction: {e}", file=sys.stderr)
+        logger.error("[QC-QSIRECON] ERROR during QC extraction: %s", e)
         raise
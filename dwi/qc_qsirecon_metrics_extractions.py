@@ -30,8 +30,7 @@ def run(config, subject, session):
     try:
         # Extract process status from log files
         finished_status, runtime = utils.read_log(config, subject, session, runtype="qsirecon")
-        dir_count = utils.count_dirs(qsirecon_dir)
-        file_count = utils.count_files(qsirecon_dir)
+        dir_count, file_count = utils.count_tree(qsirecon_dir)
 
         # Compute QC metrics
         row = dict(
@@ -1,9 +1,11 @@
-import os
+import logging
 from pathlib import Path
 import sys
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 import utils
 
+logger = logging.getLogger(__name__)
+
 
 def is_already_processed(config, subject, session):
     """
@@ -22,30 +24,7 @@ def is_already_processed(config, subject, session):
     bool
         True if already processed, False otherwise.
     """
-
-    # Check if QSIprep already processed without error
-    DERIVATIVES_DIR = config["common"]["derivatives"]
-
-    output_dir = f"{DERIVATIVES_DIR}/qsiprep/outputs/{subject}/{session}"
-    if not os.path.exists(output_dir):
-        return False
-
-    stdout_dir = f"{DERIVATIVES_DIR}/qsiprep/stdout"
-    if not os.path.exists(stdout_dir):
-        return False
-
-    prefix = f"qsiprep_{subject}_{session}"
-    stdout_files = [f for f in os.listdir(stdout_dir) if (f.startswith(prefix) and f.endswith('.out'))]
-    if not stdout_files:
-        return False
-
-    for file in stdout_files:
-        file_path = os.path.join(stdout_dir, file)
-        with open(file_path, 'r') as f:
-            if 'QSIPrep finished successfully!' in f.read():
-                return True
-
-    return False
+    return utils.is_already_processed(config, "qsiprep", subject, session)
 
 
 def generate_slurm_script(config, subject, session, path_to_script, job_ids=None):
@@ -81,10 +60,7 @@ def generate_slurm_script(config, subject, session, path_to_script, job_ids=None
         f'#SBATCH -o {DERIVATIVES_DIR}/qsiprep/stdout/%x_job-%j.out\n'
     )
 
-    if job_ids:
-        header += (
-            f'#SBATCH --dependency=afterok:{":".join(job_ids)}\n'
-        )
+    header += utils.dependency_directive(job_ids)
 
     if common.get("email"):
         header += (
@@ -95,11 +71,7 @@ def generate_slurm_script(config, subject, session, path_to_script, job_ids=None
     if common.get("account"):
         header += f'#SBATCH --account={common["account"]}\n'
 
-    module_export = (
-        f'\nmodule purge\n'
-        f'module load userspace/all\n'
-        f'module load singularity\n'
-    )
+    module_export = utils.MODULE_EXPORT
 
     # Note: Temporary binding to a local FreeSurfer version is included
     # todo: Once the PR#19 Update FreeSurfer is accepted and new container version is built,
@@ -129,8 +101,7 @@ def generate_slurm_script(config, subject, session, path_to_script, job_ids=None
     ownership_sharing = f'\nchmod -Rf 771 {DERIVATIVES_DIR}/qsiprep\n'
 
     # Write the complete SLURM script to the specified file
-    with open(path_to_script, 'w') as f:
-        f.write(header + module_export + singularity_command + ownership_sharing)
+    utils.write_script(path_to_script, header, module_export, singularity_command, ownership_sharing)
 
 
 def run_qsiprep(config, subject, session, job_ids=None):
@@ -160,18 +131,26 @@ def run_qsiprep(config, subject, session, job_ids=None):
     qsiprep = config["qsiprep"]
 
     if is_already_processed(config, subject, session) and qsiprep["skip_processed"]:
-        print(f"[QSIPREP] Skip already processed subject {subject}_{session}")
+        logger.info("[QSIPREP] Skip already processed subject %s_%s", subject, session)
         return None
 
+    # Do not submit twice a job still in the queue, downstream steps wait for the queued one
+    job_id = utils.get_active_job(f"qsiprep_{subject}_{session}")
+    if job_id:
+        logger.info("[QSIPREP] Job %s already queued for %s_%s", job_id, subject, session)
+        return job_id
+
     # Create output (derivatives) directories
-    os.makedirs(f"{DERIVATIVES_DIR}/qsiprep", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qsiprep/stdout", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qsiprep/scripts", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qsiprep/outputs", exist_ok=True)
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/qsiprep",
+        f"{DERIVATIVES_DIR}/qsiprep/stdout",
+        f"{DERIVATIVES_DIR}/qsiprep/scripts",
+        f"{DERIVATIVES_DIR}/qsiprep/outputs",
+    )
 
     path_to_script = f"{DERIVATIVES_DIR}/qsiprep/scripts/{subject}_{session}_qsiprep.slurm"
     generate_slurm_script(config, subject, session, path_to_script, job_ids)
 
-    cmd = f"sbatch {path_to_script}"
+    cmd = ["sbatch", path_to_script]
     job_id = utils.submit_job(cmd)
     return job_id
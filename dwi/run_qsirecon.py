@@ -1,9 +1,11 @@
-import os
+import logging
 from pathlib import Path
 import sys
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 import utils
 
+logger = logging.getLogger(__name__)
+
 
 # --------------------------------------------
 # HELPERS
@@ -24,29 +26,7 @@ def is_already_processed(config, subject, session):
     bool
         True if already processed, False otherwise.
     """
-    # Check if qsirecon already processed without error
-    DERIVATIVES_DIR = config["common"]["derivatives"]
-
-    output_dir = f"{DERIVATIVES_DIR}/qsirecon/outputs/{subject}/{session}"
-    if not os.path.exists(output_dir):
-        return False
-
-    stdout_dir = f"{DERIVATIVES_DIR}/qsirecon/stdout"
-    if not os.path.exists(stdout_dir):
-        return False
-
-    prefix = f"qsirecon_{subject}_{session}"
-    stdout_files = [f for f in os.listdir(stdout_dir) if (f.startswith(prefix) and f.endswith('.out'))]
-    if not stdout_files:
-        return False
-
-    for file in stdout_files:
-        file_path = os.path.join(stdout_dir, file)
-        with open(file_path, 'r') as f:
-            if 'QSIRecon finished successfully!' in f.read():
-                return True
-
-    return False
+    return utils.is_already_processed(config, "qsirecon", subject, session)
 
 
 def generate_slurm_script(config, subject, session, path_to_script, job_ids=None):
@@ -83,10 +63,7 @@ def generate_slurm_script(config, subject, session, path_to_script, job_ids=None
         f'#SBATCH -o {DERIVATIVES_DIR}/qsirecon/stdout/%x_job-%j.out\n'
     )
 
-    if job_ids:
-        header += (
-            f'#SBATCH --dependency=afterok:{":".join(job_ids)}\n'
-        )
+    header += utils.dependency_directive(job_ids)
 
     if common.get("email"):
         header += (
@@ -97,11 +74,7 @@ def generate_slurm_script(config, subject, session, path_to_script, job_ids=None
     if common.get("account"):
         header += f'#SBATCH --account={common["account"]}\n'
 
-    module_export = (
-        f'\nmodule purge\n'
-        f'module load userspace/all\n'
-        f'module load singularity\n'
-    )
+    module_export = utils.MODULE_EXPORT
 
     prereq_check = (
         f'\n# Check that FreeSurfer finished without error\n'
@@ -152,8 +125,7 @@ def generate_slurm_script(config, subject, session, path_to_script, job_ids=None
     ownership_sharing = f'\nchmod -Rf 771 {DERIVATIVES_DIR}/qsirecon\n'
 
     # Write the complete SLURM script to the specified file
-    with open(path_to_script, 'w') as f:
-        f.write(header + module_export + prereq_check + singularity_command + ownership_sharing)
+    utils.write_script(path_to_script, header, module_export, prereq_check, singularity_command, ownership_sharing)
 
 
 def run_qsirecon(config, subject, session, job_ids=None):
@@ -183,18 +155,26 @@ def run_qsirecon(config, subject, session, job_ids=None):
     qsirecon = config["qsirecon"]
 
     if is_already_processed(config, subject, session) and qsirecon["skip_processed"]:
-        print(f"[QSIRECON] Skip already processed subject {subject}_{session}")
+        logger.info("[QSIRECON] Skip already processed subject %s_%s", subject, session)
         return None
 
+    # Do not submit twice a job still in the queue, downstream steps wait for the queued one
+    job_id = utils.get_active_job(f"qsirecon_{subject}_{session}")
+    if job_id:
+        logger.info("[QSIRECON] Job %s already queued for %s_%s", job_id, subject, session)
+        return job_id
+
     # Create output (derivatives) directories
-    os.makedirs(f"{DERIVATIVES_DIR}/qsirecon", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qsirecon/stdout", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qsirecon/scripts", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qsirecon/outputs", exist_ok=True)
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/qsirecon",
+        f"{DERIVATIVES_DIR}/qsirecon/stdout",
+        f"{DERIVATIVES_DIR}/qsirecon/scripts",
+        f"{DERIVATIVES_DIR}/qsirecon/outputs",
+    )
 
     path_to_script = f"{DERIVATIVES_DIR}/qsirecon/scripts/{subject}_{session}_qsirecon.slurm"
     generate_slurm_script(config, subject, session, path_to_script, job_ids)
 
-    cmd = f"sbatch {path_to_script}"
+    cmd = ["sbatch", path_to_script]
     job_id = utils.submit_job(cmd)
     return job_id
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
+import csv
+import mmap
 import os
+import shlex
 import sys
 import subprocess
-import shutil
 import config_loader
-import pandas as pd
+import utils
 from legacy.qc.qc_generator import generate_qc_pdf
 
 
@@ -22,6 +24,19 @@ print("FREESURFER_HOME:", os.environ['FREESURFER_HOME'])
 print("FS_LICENSE:", os.environ['FS_LICENSE'])
 print("SUBJECTS_DIR:", os.environ['SUBJECTS_DIR'])
 
+# Container invocation shared by all subjects, followed by the recon-all script of each subject
+_APPTAINER_PREFIX = [
+    "apptainer", "exec",
+    "-B", f"{config_loader.DIR_INPUTS}:/data",
+    "-B", f"{config_loader.FREESURFER_OUTPUTS}:/output",
+    "-B", f"{config_loader.FS_LICENSE}:/usr/local/freesurfer/license.txt",
+    config_loader.FREESURFER_SIF,
+    "bash", "-c",
+]
+# recon-all -parallel processes both hemispheres at once, using the CPUs allotted to this process
+_OPENMP_THREADS = len(os.sched_getaffinity(0))
+
+
 def log_path(tool, subject):
     """Generate log file path.
     """
@@ -31,8 +46,9 @@ def log_path(tool, subject):
 def run_cmd(cmd, logfile):
     """Run a command and log output to a file."""
     print(f"\n[RUNNING] {' '.join(cmd)}")
-    with open(logfile, "w") as f:
-        subprocess.run(cmd, stdout=f, stderr=f, text=True, check=True)
+    # stderr is merged into stdout: the child writes both straight to the log file
+    with open(logfile, "wb", buffering=0) as f:
+        subprocess.run(cmd, stdout=f, stderr=subprocess.STDOUT, check=True)
 
 
 def run_freesurfer(subject):
@@ -42,21 +58,17 @@ def run_freesurfer(subject):
     # Cleanup previous recon (optional)
     subject_dir = f"{config_loader.FREESURFER_OUTPUTS}/{subject}"
     if os.path.exists(subject_dir):
-        shutil.rmtree(subject_dir)
-
-    cmd = [
-    "apptainer", "exec",
-    "-B", f"{config_loader.DIR_INPUTS}:/data",
-    "-B", f"{config_loader.FREESURFER_OUTPUTS}:/output",
-    "-B", f"{config_loader.FS_LICENSE}:/usr/local/freesurfer/license.txt",
-    config_loader.FREESURFER_SIF,
-    "bash", "-c",
-    "export FREESURFER_HOME=/usr/local/freesurfer && "
-    "source $FREESURFER_HOME/SetUpFreeSurfer.sh && "
-    f"recon-all -all -s {subject} "
-    f"-i /data/{subject}/ses-01/anat/{subject}_ses-01_T1w.nii.gz "
-    f"-sd /output"
-]
+        utils.remove_dir(subject_dir)
+
+    quoted = shlex.quote(subject)
+    script = (
+        "export FREESURFER_HOME=/usr/local/freesurfer && "
+        "source $FREESURFER_HOME/SetUpFreeSurfer.sh && "
+        f"recon-all -all -parallel -openmp {_OPENMP_THREADS} -s {quoted} "
+        f"-i /data/{quoted}/ses-01/anat/{quoted}_ses-01_T1w.nii.gz "
+        f"-sd /output"
+    )
+    cmd = _APPTAINER_PREFIX + [script]
 
     run_cmd(cmd, log_path("freesurfer", subject))
 
@@ -65,10 +77,16 @@ def extract_qc(subject):
     if not os.path.exists(stats_file):
         return None
 
+    # Only the last "CortexVolume" line matters: search it from the end, without decoding the file
     cortex_size = 0
-    for line in open(stats_file):
-        if "CortexVolume" in line:
-            cortex_size = int(line.split()[3])
+    with open(stats_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = mm.rfind(b"CortexVolume")
+                if start >= 0:
+                    start = mm.rfind(b"\n", 0, start) + 1
+                    end = mm.find(b"\n", start)
+                    cortex_size = int(mm[start:end if end >= 0 else len(mm)].split()[3])
 
     return {"subject": subject, "cortex_volume": cortex_size}
 
@@ -81,11 +99,12 @@ def main(subject):
     qc = extract_qc(subject)
 
     if qc:
-        df = pd.DataFrame([qc])
-        if not os.path.exists(config_loader.QC_TABLE):
-            df.to_csv(config_loader.QC_TABLE, index=False)
-        else:
-            df.to_csv(config_loader.QC_TABLE, mode='a', header=False, index=False)
+        write_header = not os.path.exists(config_loader.QC_TABLE)
+        with open(config_loader.QC_TABLE, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(qc), lineterminator="\n")
+            if write_header:
+                writer.writeheader()
+            writer.writerow(qc)
 
     generate_qc_pdf(subject, config_loader.FREESURFER_OUTPUTS,
                     f"{config_loader.LOG_DIR}/freesurfer/{subject}_qc.pdf")
@@ -7,6 +7,31 @@ import utils
 sys.path.append(str(Path(__file__).parent.parent))
 
 
+def fill_args(args, config, step):
+    """
+    Set the common, SLURM and step-specific settings of the config on `args`.
+
+    Settings already set on `args` are kept, and earlier sections take precedence over later ones.
+
+    Parameters
+    ----------
+    args : Namespace
+        Arguments of the step (e.g., from the command line).
+    config : dict
+        Configuration, with 'common', 'slurm' and per-step sections.
+    step : str
+        Section of the step (e.g., 'qsiprep').
+    """
+    values = {}
+    for sub_key in ('common', 'slurm', step):
+        for key, value in config.get(sub_key, {}).items():
+            if values.get(key) is None:
+                values[key] = value
+    for key, value in values.items():
+        if getattr(args, key, None) is None:
+            setattr(args, key, value)
+
+
 def run_qsiprep(args, freesurfer_job_ids=None):
     """
 
@@ -401,12 +426,7 @@ def main_old(raw_args=None):
     # Read arguments from config file. Values in file will be overridden by command-line arguments.
     general_config_file = f"{Path(__file__).parent.parent}/config.json"
     config = load_config(general_config_file)
-    sub_keys = ['common', 'slurm', 'qsiprep']
-    for sub_key in sub_keys:
-        workflow_config = config.get(sub_key, {})
-        for key, value in workflow_config.items():
-            if getattr(args, key, None) is None:
-                setattr(args, key, value)
+    fill_args(args, config, 'qsiprep')
 
     # Save config in json
     config = vars(args)
@@ -428,12 +448,7 @@ def main():
     args = SimpleNamespace()
     general_config_file = f"{Path(__file__).parent.parent}/config.json"
     config = utils.load_config(general_config_file)
-    sub_keys = ['common', 'slurm', 'qsiprep']
-    for sub_key in sub_keys:
-        workflow_config = config.get(sub_key, {})
-        for key, value in workflow_config.items():
-            if getattr(args, key, None) is None:
-                setattr(args, key, value)
+    fill_args(args, config, 'qsiprep')
 
     args.output_dir = f"{args.derivatives}/qsiprep"
 
@@ -452,12 +467,7 @@ def main():
     args = SimpleNamespace()
     general_config_file = f"{Path(__file__).parent.parent}/config.json"
     config = utils.load_config(general_config_file)
-    sub_keys = ['common', 'slurm', 'qsirecon']
-    for sub_key in sub_keys:
-        workflow_config = config.get(sub_key, {})
-        for key, value in workflow_config.items():
-            if getattr(args, key, None) is None:
-                setattr(args, key, value)
+    fill_args(args, config, 'qsirecon')
 
     args.output_dir = f"{args.derivatives}/qsirecon"
 
@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 import json
+import logging
 import warnings
-import os
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from rsfmri.qc_fmriprep_metrics_extractions import run as extract_qc_metrics
 import utils
+
+logger = logging.getLogger(__name__)
+
 warnings.filterwarnings("ignore")
 
 
@@ -47,8 +50,7 @@ def generate_slurm_script(config, subject, session, path_to_script, job_ids=None
         f'#SBATCH --partition={mriqc["partition"]}\n'
     )
 
-    if job_ids:
-        header += f'#SBATCH --dependency=afterok:{":".join(job_ids)}\n'
+    header += utils.dependency_directive(job_ids)
 
     if common.get("email"):
         header += (
@@ -123,8 +125,7 @@ def generate_slurm_script(config, subject, session, path_to_script, job_ids=None
     )
 
     # Write the complete SLURM script to the specified file
-    with open(path_to_script, 'w') as f:
-        f.write(header + module_export + prereq_check + singularity_cmd + python_command + ownership_sharing)
+    utils.write_script(path_to_script, header, module_export, prereq_check, singularity_cmd, python_command, ownership_sharing)
 
 
 def run_qc_fmriprep(config, subject, session, job_ids=None):
@@ -150,26 +151,33 @@ def run_qc_fmriprep(config, subject, session, job_ids=None):
     common = config["common"]
     DERIVATIVES_DIR = common["derivatives"]
 
+    # Nothing to check if fMRIPrep was neither submitted in this run nor run before
+    if not job_ids and not utils.is_already_processed(config, "fmriprep", subject, session):
+        logger.warning("[QC-FMRIPREP] fMRIPrep did not terminate for %s %s. Please run fMRIPrep command before QC.", subject, session)
+        return None
+
     # Create output (derivatives) directories
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/fmriprep", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/fmriprep/outputs", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/fmriprep/stdout", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/fmriprep/scripts", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/fmriprep/work", exist_ok=True)
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/qc/fmriprep",
+        f"{DERIVATIVES_DIR}/qc/fmriprep/outputs",
+        f"{DERIVATIVES_DIR}/qc/fmriprep/stdout",
+        f"{DERIVATIVES_DIR}/qc/fmriprep/scripts",
+        f"{DERIVATIVES_DIR}/qc/fmriprep/work",
+    )
 
     if not utils.is_mriqc_done(config, subject, session, runtype='fmriprep'):
         path_to_script = f"{DERIVATIVES_DIR}/qc/fmriprep/scripts/qc_fmriprep_{subject}_{session}.slurm"
         generate_slurm_script(config, subject, session, path_to_script, job_ids=job_ids)
-        cmd = f"sbatch {path_to_script}"
-        print(f"[QC-FMRIPREP] Submitting job: {cmd}")
+        cmd = ["sbatch", path_to_script]
+        logger.info("[QC-FMRIPREP] Submitting job: %s", " ".join(cmd))
         job_id = utils.submit_job(cmd)
         return job_id
 
     else:
-        print(f"[QC-FMRIPREP] Skip already processed MRIQC")
-        print(f"[QC-FMRIPREP] Performing only python command extraction for {subject}_{session}")
+        logger.info("[QC-FMRIPREP] Skip already processed MRIQC")
+        logger.info("[QC-FMRIPREP] Performing only python command extraction for %s_%s", subject, session)
         try:
             extract_qc_metrics(config, subject, session)
         except Exception as e:
-            print(f"[QC-FMRIPREP] ERROR during QC extraction: {e}", file=sys.stderr)
+            logger.error("[QC-FMRIPREP] ERROR during QC extraction: %s", e)
             raise
\ No newline at end of file
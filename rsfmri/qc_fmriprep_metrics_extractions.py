@@ -49,8 +49,7 @@ def run(config, subject, session):
         try:
             # Extract process status from log files
             finished_status, runtime = utils.read_log(config, subject, session, runtype="fmriprep")
-            dir_count = utils.count_dirs(fmriprep_dir)
-            file_count = utils.count_files(fmriprep_dir)
+            dir_count, file_count = utils.count_tree(fmriprep_dir)
 
             # Load TSV file produced by FMRIprep
             fmriprep_metrics = f'{subject}_{session}_task-{task}_desc-confounds_timeseries.tsv'
@@ -84,10 +83,9 @@ def run(config, subject, session):
             t1w_mask_img = utils.load_any_image(t1w_mask)
             t1w_mask_data = t1w_mask_img.get_fdata()
             bold_img = utils.load_any_image(bold)
-            bold_data = bold_img.get_fdata()
 
-            # Compute mean BOLD image
-            mean_bold = np.mean(bold_data, axis=3)
+            # Compute mean BOLD image (the series is read in its stored type, not copied to float64)
+            mean_bold = np.mean(np.asanyarray(bold_img.dataobj), axis=3, dtype=np.float64)
 
             # Load masks for voxel counts
             bold_mask_img = utils.load_any_image(bold_mask)
@@ -104,7 +102,7 @@ def run(config, subject, session):
 
             # Resample bold into t1w space
             bold_brain_hr = utils.resample(bold_brain, t1w_data)
-            bold_mask_data_hr = utils.resample(bold_mask_data, t1w_data)
+            bold_mask_data_hr = utils.resample(bold_mask_data, t1w_data, order=0)
 
             # Compute QC metrics
             row = dict(
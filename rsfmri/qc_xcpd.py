@@ -1,11 +1,85 @@
 #!/usr/bin/env python3
-import os
+import json
+import logging
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
+import utils
 from rsfmri.qc_xcpd_metrics_extractions import run as extract_qc_metrics
 from rsfmri.run_xcpd import is_already_processed as is_xcpd_done
 
+logger = logging.getLogger(__name__)
+
+
+# ------------------------
+# Create SLURM job script for QC XCP-D
+# ------------------------
+def generate_slurm_script(config, subject, session, path_to_script, job_ids=None):
+    """
+    Generate the SLURM job script extracting QC metrics once XCP-D is done.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary.
+    subject : str
+        Subject identifier.
+    session : str
+        Session identifier.
+    path_to_script : str
+        Path to save the generated SLURM script.
+    job_ids : list, optional
+        List of SLURM job IDs to set as dependencies (default is None).
+    """
+
+    common = config["common"]
+    mriqc = config["mriqc"]
+    DERIVATIVES_DIR = common["derivatives"]
+
+    header = (
+        f'#!/bin/bash\n'
+        f'#SBATCH --job-name=qc_xcpd_{subject}_{session}\n'
+        f'#SBATCH --output={DERIVATIVES_DIR}/qc/xcpd/stdout/qc_xcpd_{subject}_{session}_%j.out\n'
+        f'#SBATCH --error={DERIVATIVES_DIR}/qc/xcpd/stdout/qc_xcpd_{subject}_{session}_%j.err\n'
+        f'#SBATCH --mem={mriqc["requested_mem"]}\n'
+        f'#SBATCH --time={mriqc["requested_time"]}\n'
+        f'#SBATCH --partition={mriqc["partition"]}\n'
+    )
+
+    header += utils.dependency_directive(job_ids)
+
+    if common.get("email"):
+        header += (
+            f'#SBATCH --mail-type={common["email_frequency"]}\n'
+            f'#SBATCH --mail-user={common["email"]}\n'
+        )
+
+    if common.get("account"):
+        header += f'#SBATCH --account={common["account"]}\n'
+
+    module_export = (
+        f'\nmodule purge\n'
+        f'module load userspace/all\n'
+        f'module load python3/3.12.0\n'
+        f'source {common["python_env"]}/bin/activate\n'
+    )
+
+    python_command = (
+        f'\necho "Running QC metrics extraction"\n'
+        f'python3 rsfmri/qc_xcpd_metrics_extractions.py '
+        f"'{json.dumps(config)}' '{subject}' '{session}'\n"
+    )
+
+    # Add permissions for shared ownership of the output directory
+    ownership_sharing = (
+        f'\nstatus=$?\n'
+        f'chmod -Rf 771 {DERIVATIVES_DIR}/qc/xcpd/outputs\n'
+        f'exit $status\n'
+    )
+
+    # Write the complete SLURM script to the specified file
+    utils.write_script(path_to_script, header, module_export, python_command, ownership_sharing)
+
 
 def run_qc_xcpd(config, subject, session, job_ids=None):
     """
@@ -21,25 +95,41 @@ def run_qc_xcpd(config, subject, session, job_ids=None):
         Session identifier.
     job_ids: list, optional
         List of SLURM job IDs to set as dependencies (default is None).
+
+    Returns
+    -------
+    str or None
+        SLURM job ID if QC is submitted as a job waiting for XCP-D, None if it is run directly.
     """
 
     common = config["common"]
     DERIVATIVES_DIR = common["derivatives"]
 
     # Create output (derivatives) directories
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/xcpd", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/xcpd/outputs", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/xcpd/stdout", exist_ok=True)
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/qc/xcpd",
+        f"{DERIVATIVES_DIR}/qc/xcpd/outputs",
+        f"{DERIVATIVES_DIR}/qc/xcpd/stdout",
+        f"{DERIVATIVES_DIR}/qc/xcpd/scripts",
+    )
+
+    # XCP-D was submitted in this run: extract QC metrics in a job waiting for it
+    if job_ids:
+        path_to_script = f"{DERIVATIVES_DIR}/qc/xcpd/scripts/qc_xcpd_{subject}_{session}.slurm"
+        generate_slurm_script(config, subject, session, path_to_script, job_ids=job_ids)
+        cmd = ["sbatch", path_to_script]
+        logger.info("[QC-XCPD] Submitting job: %s", " ".join(cmd))
+        return utils.submit_job(cmd)
 
     if not is_xcpd_done(config, subject, session):
-        print(f"[QC-XCPD] XCP-D did not terminate for {subject} {session}. Please run XCP-D command before QC.")
+        logger.warning("[QC-XCPD] XCP-D did not terminate for %s %s. Please run XCP-D command before QC.", subject, session)
         return None
 
-    print(f"[QC-XCPD] Performing QC metric extraction for {subject} {session}")
+    logger.info("[QC-XCPD] Performing QC metric extraction for %s %s", subject, session)
     try:
         extract_qc_metrics(config, subject, session)
     except Exception as e:
-        print(f"[QC-XCPD] ERROR during QC extraction: {e}", file=sys.stderr)
+        logger.error("[QC-XCPD] ERROR during QC extraction: %s", e)
         raise
 
     # todo: qc group récupérer les valeurs de sub-003_ses-01_task-rest_space-fsLR_den-91k_desc-linc_qc.tsv
\ No newline at end of file
@@ -61,8 +61,7 @@ def run(config, subject, session):
         try:
             # Extract process status from log files
             finished_status, runtime = utils.read_log(config, subject, session, runtype="xcpd")
-            dir_count = utils.count_dirs(xcpd_dir)
-            file_count = utils.count_files(xcpd_dir)
+            dir_count, file_count = utils.count_tree(xcpd_dir)
 
             # Load TSV file produced by XCP-D
             xcpd_metrics = f'{subject}_{session}_task-{task}_motion.tsv'
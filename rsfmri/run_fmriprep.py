@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
-import os
+import logging
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 import utils
 
+logger = logging.getLogger(__name__)
+
 
 # ------------------------------
 # HELPERS
@@ -13,11 +15,11 @@ def check_prerequisites(config, subject, session):
     # Check required files
     BIDS_DIR = config["common"]["input_dir"]
     if not utils.has_anat(BIDS_DIR, subject):
-        print(f"[FMRIPREP] ERROR - No anatomical data found for {subject} {session}.")
+        logger.error("[FMRIPREP] ERROR - No anatomical data found for %s %s.", subject, session)
         return False
 
     if not utils.has_func_fmap(BIDS_DIR, subject):
-        print(f"[FMRIPREP] ERROR - No functional data found for {subject} {session}.")
+        logger.error("[FMRIPREP] ERROR - No functional data found for %s %s.", subject, session)
         return False
     return True
 
@@ -39,29 +41,7 @@ def is_already_processed(config, subject, session):
     bool
         True if already processed, False otherwise.
     """
-    # Check if fmriprep already processed without error
-    DERIVATIVES_DIR = config["common"]["derivatives"]
-
-    output_dir = f"{DERIVATIVES_DIR}/fmriprep/outputs/{subject}/{session}"
-    if not os.path.exists(output_dir):
-        return False
-
-    stdout_dir = f"{DERIVATIVES_DIR}/fmriprep/stdout"
-    if not os.path.exists(stdout_dir):
-        return False
-
-    prefix = f"fmriprep_{subject}_{session}"
-    stdout_files = [f for f in os.listdir(stdout_dir) if (f.startswith(prefix) and f.endswith('.out'))]
-    if not stdout_files:
-        return False
-
-    for file in stdout_files:
-        file_path = os.path.join(stdout_dir, file)
-        with open(file_path, 'r') as f:
-            if 'fMRIPrep finished successfully!' in f.read():
-                return True
-
-    return False
+    return utils.is_already_processed(config, "fmriprep", subject, session)
 
 
 # ------------------------
@@ -117,8 +97,7 @@ def generate_slurm_fmriprep_script(config, subject, session, path_to_script, fs_
         f'#SBATCH --partition={fmriprep["partition"]}\n'
     )
 
-    if job_ids:
-        header += f'#SBATCH --dependency=afterok:{":".join(job_ids)}\n'
+    header += utils.dependency_directive(job_ids)
 
     if common.get("email"):
         header += (
@@ -129,11 +108,7 @@ def generate_slurm_fmriprep_script(config, subject, session, path_to_script, fs_
     if common.get("account"):
         header += f'#SBATCH --account={common["account"]}\n'
 
-    module_export = (
-        f'\nmodule purge\n'
-        f'module load userspace/all\n'
-        f'module load singularity\n'
-
+    module_export = utils.MODULE_EXPORT + (
         f'echo "------ Running {fmriprep["fmriprep_container"]} for subject: {subject}, session: {session} --------"\n'
     )
 
@@ -178,16 +153,28 @@ def generate_slurm_fmriprep_script(config, subject, session, path_to_script, fs_
     )
 
     # FMRIPrep does not handle correctly the sessionwise option and leaves the anat folder in a common directory
-    # for all sessions. Here we just move all files into the session's subdirectory
+    # for all sessions. Here we just move all files into the session's subdirectory: a rename when the session has
+    # no anat folder yet (no data copied on the shared filesystem), a merge with rsync otherwise.
+    # The fMRIPrep exit status is kept so that dependent jobs (afterok) do not start after a failure
     save_work = (
-        f'\nrsync -av {DERIVATIVES_DIR}/fmriprep/outputs/{subject}/anat/ {DERIVATIVES_DIR}/fmriprep/outputs/{subject}/{session}/anat/\n'
-        f'\nrm -rf {DERIVATIVES_DIR}/fmriprep/outputs/{subject}/anat\n'
+        f'\nstatus=$?\n'
+        f'\nanat_dir={DERIVATIVES_DIR}/fmriprep/outputs/{subject}/anat\n'
+        f'session_anat_dir={DERIVATIVES_DIR}/fmriprep/outputs/{subject}/{session}/anat\n'
+        f'if [ -d "$anat_dir" ]; then\n'
+        f'    if [ ! -e "$session_anat_dir" ]; then\n'
+        f'        mkdir -p {DERIVATIVES_DIR}/fmriprep/outputs/{subject}/{session}\n'
+        f'        mv "$anat_dir" "$session_anat_dir"\n'
+        f'    else\n'
+        f'        rsync -av "$anat_dir"/ "$session_anat_dir"/\n'
+        f'        rm -rf "$anat_dir"\n'
+        f'    fi\n'
+        f'fi\n'
         f'\nchmod -Rf 771 {DERIVATIVES_DIR}/fmriprep\n'
+        f'\nexit $status\n'
     )
 
     # Write the complete SLURM script to the specified file
-    with open(path_to_script, 'w') as f:
-        f.write(header + module_export + prereq_check + singularity_command + save_work)
+    utils.write_script(path_to_script, header, module_export, prereq_check, singularity_command, save_work)
 
 
 def run_fmriprep(config, subject, session, job_ids=None):
@@ -215,19 +202,27 @@ def run_fmriprep(config, subject, session, job_ids=None):
         return None
 
     if is_already_processed(config, subject, session) and fmriprep["skip_processed"]:
-        print(f"[FMRIPREP] Skip already processed subject {subject}_{session}")
+        logger.info("[FMRIPREP] Skip already processed subject %s_%s", subject, session)
         return None
 
+    # Do not submit twice a job still in the queue, downstream steps wait for the queued one
+    job_id = utils.get_active_job(f"fmriprep_{subject}_{session}")
+    if job_id:
+        logger.info("[FMRIPREP] Job %s already queued for %s_%s", job_id, subject, session)
+        return job_id
+
     # Create output (derivatives) directories if they do not exist
-    os.makedirs(f"{DERIVATIVES_DIR}/fmriprep", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/fmriprep/outputs", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/fmriprep/work", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/fmriprep/stdout", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/fmriprep/scripts", exist_ok=True)
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/fmriprep",
+        f"{DERIVATIVES_DIR}/fmriprep/outputs",
+        f"{DERIVATIVES_DIR}/fmriprep/work",
+        f"{DERIVATIVES_DIR}/fmriprep/stdout",
+        f"{DERIVATIVES_DIR}/fmriprep/scripts",
+    )
 
     path_to_script = f"{DERIVATIVES_DIR}/fmriprep/scripts/{subject}_{session}_fmriprep.slurm"
     generate_slurm_fmriprep_script(config, subject, session, path_to_script, job_ids=job_ids)
 
-    cmd = f"sbatch {path_to_script}"
+    cmd = ["sbatch", path_to_script]
     job_id = utils.submit_job(cmd)
     return job_id
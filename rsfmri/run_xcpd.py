@@ -7,11 +7,14 @@ Usage:
     python run_xcpd.py
 
     """
-import os
+import logging
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 import utils
+from rsfmri.run_fmriprep import is_already_processed as is_fmriprep_done
+
+logger = logging.getLogger(__name__)
 
 
 # ------------------------------
@@ -34,30 +37,7 @@ def is_already_processed(config, subject, session):
     bool
         True if already processed, False otherwise.
     """
-
-    # Check if xcpd already processed without error
-    DERIVATIVES_DIR = config["common"]["derivatives"]
-
-    output_dir = f"{DERIVATIVES_DIR}/xcpd/outputs/{subject}/{session}"
-    if not os.path.exists(output_dir):
-        return False
-
-    stdout_dir = f"{DERIVATIVES_DIR}/xcpd/stdout"
-    if not os.path.exists(stdout_dir):
-        return False
-
-    prefix = f"xcpd_{subject}_{session}"
-    stdout_files = [f for f in os.listdir(stdout_dir) if (f.startswith(prefix) and f.endswith('.out'))]
-    if not stdout_files:
-        return False
-
-    for file in stdout_files:
-        file_path = os.path.join(stdout_dir, file)
-        with open(file_path, 'r') as f:
-            if 'XCP-D finished successfully!' in f.read():
-                return True
-
-    return False
+    return utils.is_already_processed(config, "xcpd", subject, session)
 
 
 # -----------------------
@@ -92,10 +72,7 @@ def generate_slurm_xcpd_script(config, subject, session, path_to_script, job_ids
         f'#SBATCH --partition={xcpd["partition"]}\n'
     )
 
-    if job_ids:
-        header += (
-            f'#SBATCH --dependency=afterok:{":".join(job_ids)}\n'
-        )
+    header += utils.dependency_directive(job_ids)
                     
     if common.get("email"):
         header += (
@@ -106,34 +83,8 @@ def generate_slurm_xcpd_script(config, subject, session, path_to_script, job_ids
     if common.get("account"):
         header += f'#SBATCH --account={common["account"]}\n'
 
-    module_export = (
-        f'\nmodule purge\n'
-        f'module load userspace/all\n'
-        f'module load singularity\n'
-    )
+    module_export = utils.MODULE_EXPORT
 
-    prereq_check = (
-        f'\n# Check that FMRIPREP outputs exists\n'
-        f'if [ ! -d "{DERIVATIVES_DIR}/fmriprep/outputs/{subject}/{session}" ]; then\n'
-        f'    echo "[XCP-D] Please run Fmriprep command before XCP-D."\n'
-        f'    exit 1\n'
-        f'fi\n'
-        
-        f'\n# Check that FMRIPREP finished without error\n'
-        f'prefix="{DERIVATIVES_DIR}/fmriprep/stdout/fmriprep_{subject}_{session}"\n'
-        f'found_success=false\n'
-        f'for file in $(ls $prefix*.out 2>/dev/null); do\n'
-        f'    if grep -q "fMRIPrep finished successfully" $file; then\n'
-        f'        found_success=true\n'
-        f'        break\n'
-        f'    fi\n'
-        f'done\n'
-        f'if [ "$found_success" = false ]; then\n'
-        f'    echo "[XCP-D] fMRIPrep did not terminate for {subject} {session}. Please run fMRIPrep command before XCP-D."\n'
-        f'    exit 1\n'
-        f'fi\n'
-    )
-    
     # Define the Singularity command for running FMRIPrep
     singularity_command = (
         f'\napptainer run --cleanenv \\\n'
@@ -154,12 +105,17 @@ def generate_slurm_xcpd_script(config, subject, session, path_to_script, job_ids
         f'      --config-file /config/xcpd_config.toml \\\n'
     )
 
-    # Add permissions for shared ownership of the output directory
-    ownership_sharing = f'\nchmod -Rf 771 {DERIVATIVES_DIR}/xcpd\n'
+    # Add permissions for shared ownership of this subject's outputs only (top-level directories are set up at
+    # submission), keeping XCP-D exit status for dependent jobs
+    ownership_sharing = (
+        f'\nstatus=$?\n'
+        f'chmod -f 771 {DERIVATIVES_DIR}/xcpd/outputs/{subject}\n'
+        f'chmod -Rf 771 {DERIVATIVES_DIR}/xcpd/outputs/{subject}/{session}\n'
+        f'exit $status\n'
+    )
 
     # Write the complete SLURM script to the specified file
-    with open(path_to_script, 'w') as f:
-        f.write(header + module_export + prereq_check + singularity_command + ownership_sharing)
+    utils.write_script(path_to_script, header, module_export, singularity_command, ownership_sharing)
 
 
 def run_xcpd(config, subject, session, job_ids=None):
@@ -185,19 +141,33 @@ def run_xcpd(config, subject, session, job_ids=None):
     xcpd = config["xcpd"]
 
     if is_already_processed(config, subject, session) and xcpd["skip_processed"]:
-        print(f"[XCP-D] Skip already processed subject {subject}_{session}")
+        logger.info("[XCP-D] Skip already processed subject %s_%s", subject, session)
         return None
 
-    # Create output (derivatives) directories
-    os.makedirs(f"{DERIVATIVES_DIR}/xcpd", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/xcpd/outputs", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/xcpd/stdout", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/xcpd/scripts", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/xcpd/work", exist_ok=True)
+    # Do not submit twice a job still in the queue, downstream steps wait for the queued one
+    job_id = utils.get_active_job(f"xcpd_{subject}_{session}")
+    if job_id:
+        logger.info("[XCP-D] Job %s already queued for %s_%s", job_id, subject, session)
+        return job_id
+
+    # Without a pending fMRIPrep job to wait for, fMRIPrep outputs must already be there
+    if not job_ids and not is_fmriprep_done(config, subject, session):
+        logger.warning("[XCP-D] fMRIPrep did not terminate for %s_%s. Please run fMRIPrep before XCP-D.", subject, session)
+        return None
+
+    # Create output (derivatives) directories, shared with the group once here rather than by every job
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/xcpd",
+        f"{DERIVATIVES_DIR}/xcpd/outputs",
+        f"{DERIVATIVES_DIR}/xcpd/stdout",
+        f"{DERIVATIVES_DIR}/xcpd/scripts",
+        f"{DERIVATIVES_DIR}/xcpd/work",
+        mode=0o771,
+    )
 
     path_to_script = f"{DERIVATIVES_DIR}/xcpd/scripts/{subject}_{session}_xcpd.slurm"
     generate_slurm_xcpd_script(config, subject, session, path_to_script, job_ids=job_ids)
 
-    cmd = f"sbatch {path_to_script}"
+    cmd = ["sbatch", path_to_script]
     job_id = utils.submit_job(cmd)
     return job_id
\ No newline at end of file
@@ -1,10 +1,9 @@
 #!/usr/bin/env python3
-import os
-import sys
-from pathlib import Path
-sys.path.append(str(Path(__file__).resolve().parent.parent))
+import logging
 import utils
 
+logger = logging.getLogger(__name__)
+
 
 # --------------------------------------------
 # HELPERS
@@ -31,21 +30,8 @@ def is_already_processed(config, subject, session, data_type="raw"):
     # Check if mriqc already processed without error
     DERIVATIVES_DIR = config["common"]["derivatives"]
     stdout_dir = f"{DERIVATIVES_DIR}/qc/{data_type}/stdout"
-    if not os.path.exists(stdout_dir):
-        return False
-
     prefix = f"qc_{data_type}_{subject}_{session}"
-    stdout_files = [f for f in os.listdir(stdout_dir) if (f.startswith(prefix) and f.endswith('.out'))]
-    if not stdout_files:
-        return False
-
-    for file in stdout_files:
-        file_path = os.path.join(stdout_dir, file)
-        with open(file_path, 'r') as f:
-            if 'MRIQC completed' in f.read():
-                return True
-
-    return False
+    return utils.has_success_log(stdout_dir, prefix, "mriqc")
 
 
 # ------------------------
@@ -81,8 +67,7 @@ def generate_slurm_script(config, subject, session, path_to_script, data_type="r
         f'#SBATCH --partition={mriqc["partition"]}\n'
     )
 
-    if job_ids:
-        header += f'#SBATCH --dependency=afterok:{":".join(job_ids)}\n'
+    header += utils.dependency_directive(job_ids)
 
     if common.get("email"):
         header += (
@@ -93,11 +78,7 @@ def generate_slurm_script(config, subject, session, path_to_script, data_type="r
     if common.get("account"):
         header += f'#SBATCH --account={common["account"]}\n'
 
-    module_export = (
-        f'\nmodule purge\n'
-        f'module load userspace/all\n'
-        f'module load singularity\n'
-    )
+    module_export = utils.MODULE_EXPORT
 
     prereq_check = (
         f'\n# Check that {data_type} finished without error\n'
@@ -165,11 +146,9 @@ def generate_slurm_script(config, subject, session, path_to_script, data_type="r
 
     # Write the complete SLURM script to the specified file
     if data_type == "raw":
-        with open(path_to_script, 'w') as f:
-            f.write(header + module_export + singularity_cmd + save_work)
+        utils.write_script(path_to_script, header, module_export, singularity_cmd, save_work)
     else:
-        with open(path_to_script, 'w') as f:
-            f.write(header + module_export + prereq_check + singularity_cmd + save_work)
+        utils.write_script(path_to_script, header, module_export, prereq_check, singularity_cmd, save_work)
 
 
 # ------------------------------
@@ -191,27 +170,35 @@ def run_mriqc(config, subject, session, data_type="raw", job_ids=None):
     """
 
     if data_type not in ["raw", "fmriprep", "xcpd", "qsiprep", "qsirecon"]:
-        print(f"Invalid data_type: {data_type}. Must be 'raw', 'fmriprep', or 'qsiprep'.")
+        logger.error("Invalid data_type: %s. Must be 'raw', 'fmriprep', or 'qsiprep'.", data_type)
         return None
 
     DERIVATIVES_DIR = config["common"]["derivatives"]
     mriqc = config["mriqc"]
 
     if is_already_processed(config, subject, session, data_type) and mriqc["skip_processed"]:
-        print(f"[MRIQC] Skip already processed subject {subject}_{session}")
+        logger.info("[MRIQC] Skip already processed subject %s_%s", subject, session)
         return None
 
+    # Do not submit twice a job still in the queue, downstream steps wait for the queued one
+    job_id = utils.get_active_job(f"mriqc_{data_type}_{subject}_{session}")
+    if job_id:
+        logger.info("[MRIQC] Job %s already queued for %s_%s", job_id, subject, session)
+        return job_id
+
     # Create output (derivatives) directories
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/{data_type}", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/{data_type}/outputs", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/{data_type}/stdout", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/{data_type}/scripts", exist_ok=True)
-    os.makedirs(f"{DERIVATIVES_DIR}/qc/{data_type}/work", exist_ok=True)
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/qc/{data_type}",
+        f"{DERIVATIVES_DIR}/qc/{data_type}/outputs",
+        f"{DERIVATIVES_DIR}/qc/{data_type}/stdout",
+        f"{DERIVATIVES_DIR}/qc/{data_type}/scripts",
+        f"{DERIVATIVES_DIR}/qc/{data_type}/work",
+    )
 
     # Add dependency if this is not the first job in the chain
     path_to_script = f"{DERIVATIVES_DIR}/qc/{data_type}/scripts/mriqc_{subject}_{session}.slurm"
     generate_slurm_script(config, subject, session, path_to_script, data_type=data_type, job_ids=job_ids)
 
-    cmd = f"sbatch {path_to_script}"
+    cmd = ["sbatch", path_to_script]
     job_id = utils.submit_job(cmd)
     return job_id
@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
+import logging
 import os
-import sys
-from pathlib import Path
-sys.path.append(str(Path(__file__).resolve().parent.parent))
 import utils
 
+logger = logging.getLogger(__name__)
+
 
 # ------------------------
 # Create SLURM job scripts 
@@ -35,8 +35,7 @@ def generate_slurm_mriqc_script(config, input_dir, path_to_script, data_type="ra
         f'#SBATCH --partition={mriqc["partition"]}\n'
     )
 
-    if job_ids:
-        header += f'#SBATCH --dependency=afterok:{":".join(job_ids)}\n'
+    header += utils.dependency_directive(job_ids)
 
     if common.get("email"):
         header += (
@@ -47,11 +46,7 @@ def generate_slurm_mriqc_script(config, input_dir, path_to_script, data_type="ra
     if common.get("account"):
         header += f'#SBATCH --account={common["account"]}\n'
 
-    module_export = (
-        f'\nmodule purge\n'
-        f'module load userspace/all\n'
-        f'module load singularity\n'
-    )
+    module_export = utils.MODULE_EXPORT
 
     # Define the Singularity command for running MRIQC
     # Note: Unlike fmriprep, no config file is used here, the option doesn't exist for mriqc
@@ -65,19 +60,24 @@ def generate_slurm_mriqc_script(config, input_dir, path_to_script, data_type="ra
         f'    --mem {mriqc["requested_mem"]} \\\n'
         f'    -w /out/work \\\n'
         f'    --fd_thres 0.5 \\\n'
-        f'    --verbose-reports \\\n'
-        f'    --verbose \\\n'
-        f'    --no-sub --notrack\n'
     )
 
+    # Verbose group reports and logs are large, only produce them on demand
+    if mriqc.get("verbose", False):
+        singularity_cmd += (
+            f'    --verbose-reports \\\n'
+            f'    --verbose \\\n'
+        )
+
+    singularity_cmd += f'    --no-sub --notrack\n'
+
     save_work = (
         f'\nmv {DERIVATIVES_DIR}/qc/{data_type}/outputs/group* {DERIVATIVES_DIR}/qc/{data_type}/\n'
         f'\nchmod -Rf 771 {DERIVATIVES_DIR}/qc/{data_type}\n'
     )
 
     # Write the complete SLURM script to the specified file
-    with open(path_to_script, 'w') as f:
-        f.write(header + module_export + singularity_cmd + save_work)
+    utils.write_script(path_to_script, header, module_export, singularity_cmd, save_work)
 
 
 # ------------------------------
@@ -91,20 +91,29 @@ def run_mriqc_group(config, input_dir, data_type="raw", job_ids=None):
     input_dir : str
         Input directory containing the data to be processed.
     data_type : str
-        Type of data to process (possible choices: "raw", "fmriprep", "xcp_d", "qsirecon" or "qsiprep").
+        Type of data to process (possible choices: "raw", "fmriprep", "xcpd", "qsirecon" or "qsiprep").
     job_ids : list, optional
         List of SLURM job IDs to set as dependencies (default is None).
     """
 
-    if data_type not in ["raw", "fmriprep", "xcp_d", "qsiprep", "qsirecon"]:
-        print(f"Invalid data_type: {data_type}. Must be 'raw', 'fmriprep', or 'qsiprep'.")
+    if data_type not in ["raw", "fmriprep", "xcpd", "qsiprep", "qsirecon"]:
+        logger.error("Invalid data_type: %s. Must be 'raw', 'fmriprep', 'xcpd', 'qsiprep' or 'qsirecon'.", data_type)
         return None
 
     DERIVATIVES_DIR = config["common"]["derivatives"]
 
+    # Create output (derivatives) directories
+    utils.makedirs(
+        f"{DERIVATIVES_DIR}/qc/{data_type}",
+        f"{DERIVATIVES_DIR}/qc/{data_type}/outputs",
+        f"{DERIVATIVES_DIR}/qc/{data_type}/stdout",
+        f"{DERIVATIVES_DIR}/qc/{data_type}/scripts",
+        f"{DERIVATIVES_DIR}/qc/{data_type}/work",
+    )
+
     path_to_script = f"{DERIVATIVES_DIR}/qc/{data_type}/scripts/group_mriqc_{data_type}.slurm"
     generate_slurm_mriqc_script(config, input_dir, data_type=data_type, path_to_script=path_to_script, job_ids=job_ids)
 
-    cmd = f"sbatch {path_to_script}"
+    cmd = ["sbatch", path_to_script]
     job_id = utils.submit_job(cmd)
     return job_id
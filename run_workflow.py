@@ -11,34 +11,280 @@ Usage:
     python run_workflow.py [--config <path_to_config_file>]
 """
 
+import argparse
+import filecmp
+import logging
 import os
+import shutil
+import sys
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache, partial
+from importlib import import_module
 from pathlib import Path
-import sys
-from anat import qc_freesurfer
-from dwi import qc_qsiprep, qc_qsirecon
-import toml
-sys.path.append(str(Path(__file__).resolve().parent))
 import utils
-from anat.run_freesurfer import run_freesurfer
-from dwi.run_qsiprep import run_qsiprep
-from dwi.run_qsirecon import run_qsirecon
-from rsfmri.run_fmriprep import run_fmriprep
-from run_mriqc import run_mriqc
-from rsfmri.qc_fmriprep import run_qc_fmriprep
-from rsfmri.run_xcpd import run_xcpd
-from rsfmri.qc_xcpd import run_qc_xcpd
-from run_mriqc_group import run_mriqc_group
-
-
-def main(config_file=None):
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------------
+# Workflow steps run for each subject and session:
+#   name: (workflow option, label, "module:function", upstream steps)
+# A step waits (afterok) for the jobs of its upstream steps that are enabled and submitted.
+# The modules are only imported for the enabled steps (see `load_runner`).
+# -------------------------------------------------------
+STAGES = {
+    "mriqc_raw": ("run_mriqc_raw", "MRIQC-RAW", "run_mriqc:run_mriqc", []),
+    "freesurfer": ("run_freesurfer", "FREESURFER", "anat.run_freesurfer:run_freesurfer", []),
+    "qsiprep": ("run_qsiprep", "QSIPREP", "dwi.run_qsiprep:run_qsiprep", []),
+    "qsiprep_qc": ("run_qsiprep_qc", "QSIPREP-QC", "dwi.qc_qsiprep:run", ["qsiprep"]),
+    "qsirecon": ("run_qsirecon", "QSIRECON", "dwi.run_qsirecon:run_qsirecon", ["freesurfer", "qsiprep"]),
+    "qsirecon_qc": ("run_qsirecon_qc", "QSIRECON-QC", "dwi.qc_qsirecon:run", ["qsirecon"]),
+    "fmriprep": ("run_fmriprep", "FMRIPREP", "rsfmri.run_fmriprep:run_fmriprep", ["freesurfer"]),
+    "fmriprep_qc": ("run_fmriprep_qc", "FMRIPREP-QC", "rsfmri.qc_fmriprep:run_qc_fmriprep", ["fmriprep"]),
+    "xcpd": ("run_xcp_d", "XCP-D", "rsfmri.run_xcpd:run_xcpd", ["fmriprep"]),
+    "xcpd_qc": ("run_xcpd_qc", "XCPD-QC", "rsfmri.qc_xcpd:run_qc_xcpd", ["xcpd"]),
+}
+
+# Fixed arguments of the steps sharing a runner
+STAGE_ARGUMENTS = {"mriqc_raw": {"data_type": "raw"}}
+
+# FMRIprep must wait for a session to be finished before running the next one
+SESSION_CHAINED = {"fmriprep"}
+
+# Group-level MRIQC runs: data type: step whose jobs are waited for
+# (QSIPrep is not listed: its group-level MRIQC run is submitted by qc_qsiprep.run_group_qc)
+MRIQC_GROUP_STEPS = {
+    "raw": "mriqc_raw",
+    "qsirecon": "qsirecon_qc",
+    "fmriprep": "fmriprep_qc",
+    "xcpd": "xcpd_qc",
+}
+
+
+def topological_order(stages):
+    """
+    Order the workflow steps so that each step comes after its upstream steps (Kahn's algorithm).
+
+    Parameters
+    ----------
+    stages : dict
+        Workflow steps, as in STAGES.
+
+    Returns
+    -------
+    list
+        Names of the steps, in submission order.
+    """
+    in_degree = {name: 0 for name in stages}
+    downstream = defaultdict(list)
+    for name, (_, _, _, upstream) in stages.items():
+        for parent in upstream:
+            if parent in stages:
+                in_degree[name] += 1
+                downstream[parent].append(name)
+
+    queue = deque(name for name, degree in in_degree.items() if degree == 0)
+    order = []
+    while queue:
+        name = queue.popleft()
+        order.append(name)
+        for child in downstream[name]:
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                queue.append(child)
+
+    if len(order) != len(stages):
+        raise ValueError(f"Circular dependency between workflow steps: {sorted(set(stages) - set(order))}")
+    return order
+
+
+def collect_dependencies(*job_id_lists):
+    """
+    Gather the SLURM job IDs a job must wait for, leaving out the steps that submitted nothing.
+
+    Parameters
+    ----------
+    *job_id_lists : list
+        Lists of job IDs (None for disabled, skipped or failed steps).
+
+    Returns
+    -------
+    list
+        Job IDs to set as dependencies, each listed once, in order of first appearance.
+    """
+    return list(dict.fromkeys(job_id for job_ids in job_id_lists for job_id in job_ids if job_id is not None))
+
+
+@lru_cache(maxsize=None)
+def load_runner(runner):
+    """
+    Import the function running a workflow step.
+
+    Parameters
+    ----------
+    runner : str
+        Module and function, as "module:function" (e.g., "anat.run_freesurfer:run_freesurfer").
+
+    Returns
+    -------
+    callable
+        The function.
+    """
+    module, function = runner.split(":")
+    return getattr(import_module(module), function)
+
+
+def enabled_stages(workflow):
+    """
+    List the workflow steps enabled in the configuration, in submission order.
+
+    Parameters
+    ----------
+    workflow : dict
+        Workflow section of the configuration.
+
+    Returns
+    -------
+    list
+        (name, label, function, upstream steps) of the enabled steps.
+    """
+    stages = []
+    for name in topological_order(STAGES):
+        option, label, runner, upstream = STAGES[name]
+        if workflow.get(option):
+            run_step = partial(load_runner(runner), **STAGE_ARGUMENTS.get(name, {}))
+            stages.append((name, label, run_step, upstream))
+    return stages
+
+
+def submit_job_arrays(config, inventory, stages):
+    """
+    Submit the enabled steps without upstream step as one job array per step, for all subjects and sessions.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary.
+    inventory : dict
+        Sessions to process by subject (see `utils.scan_bids`).
+    stages : list
+        Enabled workflow steps (see `enabled_stages`).
+
+    Returns
+    -------
+    dict
+        SLURM job ID (array task, e.g. "1234_5") by (step, subject, session), None for skipped sessions.
+    """
+    common = config["common"]
+
+    array_job_ids = {}
+    for name, label, run_step, upstream in stages:
+        if upstream or name in SESSION_CHAINED:
+            continue
+
+        logger.info("\n[%s] (job array)", label)
+        tasks = []
+        with utils.collect_submissions() as scripts:
+            for subject, sessions in inventory.items():
+                for session in sessions or []:
+                    job_id = run_step(config, subject=subject, session=session, job_ids=[])
+                    tasks.append((subject, session, job_id))
+
+        array_id = utils.submit_array(scripts, f"{name}_array", common.get("array_throttle")) if scripts else None
+        for subject, session, job_id in tasks:
+            if isinstance(job_id, utils.ArrayTask):
+                job_id = f"{array_id}_{job_id}" if array_id else None
+            array_job_ids[name, subject, session] = job_id
+
+    return array_job_ids
+
+
+def submit_subject(config, subject, sessions, stages, array_job_ids):
+    """
+    Submit the enabled workflow steps for all sessions of a subject.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary.
+    subject : str
+        Subject identifier (e.g., "sub-01").
+    sessions : list or None
+        Sessions of the subject, None if the subject does not exist in the input directory.
+    stages : list
+        Enabled workflow steps (see `enabled_stages`).
+    array_job_ids : dict
+        Jobs already submitted as job arrays (see `submit_job_arrays`).
+
+    Returns
+    -------
+    dict
+        SLURM job IDs submitted by each step, for all sessions (None if skipped or failed).
+    """
+    job_ids = defaultdict(list)
+
+    # Check if subject exists
+    if sessions is None:
+        logger.warning("[WARNING] Subject %s does not exist in the input directory. Skipping.", subject)
+        return job_ids
+
+    logger.info("\n================ %s ================", subject)
+
+    # -------------------------------------------
+    # Loop over sessions
+    # -------------------------------------------
+    # Jobs of the previous sessions, for steps chained across sessions
+    previous_sessions_job_ids = defaultdict(list)
+
+    for session in sessions:
+
+        logger.info("\n %s  -  %s \n", subject, session)
+
+        # Job submitted by each step for this session (None if disabled, skipped or failed)
+        session_job_ids = {}
+
+        for name, label, run_step, upstream in stages:
+            if (name, subject, session) in array_job_ids:
+                job_id = array_job_ids[name, subject, session]
+            else:
+                logger.info("[%s]", label)
+                dependencies = collect_dependencies(
+                    [session_job_ids.get(parent) for parent in upstream],
+                    previous_sessions_job_ids[name] if name in SESSION_CHAINED else []
+                )
+
+                job_id = run_step(
+                    config,
+                    subject=subject,
+                    session=session,
+                    job_ids=dependencies
+                )
+            session_job_ids[name] = job_id
+            job_ids[name].append(job_id)
+            if name in SESSION_CHAINED:
+                previous_sessions_job_ids[name].append(job_id)
+
+    logger.info("\n✅ Workflow submission complete for subject: %s", subject)
+    return job_ids
+
+
+def main(config_file=None, quiet=False):
     """
     Main function to execute the workflow steps based on the configuration file.
     Parameters
     ----------
     config_file : str, optional
         Path to the configuration file. If None, a default path is used.
+    quiet : bool, optional
+        Only report warnings and errors of the workflow, not the progress of the submission.
     """
+    # Messages of the driver and of the step modules, on stdout like the rest of the submission output
+    logging.basicConfig(level=logging.WARNING if quiet else logging.INFO, format="%(message)s", stream=sys.stdout)
+
+    # Date and time of this run (with microseconds, so that two runs never share it)
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S%f')
 
     # -------------------------------
     # Load configuration
@@ -49,276 +295,122 @@ def main(config_file=None):
 
     common = config["common"]
     workflow = config["workflow"]
+    utils.configure_submission(common)
 
     BIDS_DIR = common["input_dir"]
     DERIVATIVES_DIR = common["derivatives"]
 
-    # Save config with datetime
-    filename = f"{DERIVATIVES_DIR}/config_{datetime.now().strftime('%Y%m%d-%H%M%S')}.toml"
-    with open(filename, "w") as f:
-        toml.dump(config, f)
+    # Save config with datetime (copy of the file as written, comments included), unless it is the same as the
+    # latest snapshot. Copied under a temporary name first, so that an interrupted copy never leaves a truncated
+    # snapshot.
+    suffix = Path(config_file).suffix
+    snapshots = sorted(Path(DERIVATIVES_DIR).glob(f"config_*{suffix}"))
+    if not snapshots or not filecmp.cmp(config_file, snapshots[-1], shallow=False):
+        filename = f"{DERIVATIVES_DIR}/config_{timestamp}{suffix}"
+        shutil.copyfile(config_file, f"{filename}.tmp")
+        os.replace(f"{filename}.tmp", filename)
 
     # -------------------------------------------------------
     # Sanity checks
     # -------------------------------------------------------
     if not os.path.exists(BIDS_DIR):
-        print("Dataset directory does not exist.")
+        logger.error("Dataset directory does not exist.")
         return 0
 
-    subjects_sessions = []
-    freesurfer_job_ids = []
-    mriqc_job_ids = []
-    qc_qsiprep_job_ids = []
-    qc_qsirecon_job_ids = []
-    qc_fmriprep_job_ids = []
-    qc_xcpd_job_ids = []
+    # SLURM job IDs submitted by each step, for all subjects and sessions
+    job_ids = defaultdict(list)
 
     # -------------------------------------------------------
-    # Loop over subjects and sessions
-    subjects = utils.get_subjects(BIDS_DIR, common.get('subjects'))
+    # Loop over subjects and sessions (the dataset is listed once for the whole workflow)
+    inventory = utils.scan_bids(BIDS_DIR, common.get('subjects'), common.get('sessions'))
 
-    print("\nThe following subjects will be processed :", subjects)
+    logger.info("\nThe following subjects will be processed : %s", list(inventory))
 
-    # -------------------------------------------------------
-    # Workflow per subject
-    # -------------------------------------------------------
-    for subject in subjects:
-        # Check if subject exists
-        if not utils.subject_exists(BIDS_DIR, subject):
-            print(f"[WARNING] Subject {subject} does not exist in the input directory. Skipping.")
-            continue
-
-        print(f"\n================ {subject} ================")
+    # Enabled steps, in submission order, the same for all sessions
+    stages = enabled_stages(workflow)
 
-        # -------------------------------------------
-        # Loop over sessions
-        # -------------------------------------------
-        sessions = utils.get_sessions(BIDS_DIR, subject, common.get('sessions'))
+    # Steps without upstream step can be submitted at once for all subjects, as job arrays
+    array_job_ids = submit_job_arrays(config, inventory, stages) if common.get("job_arrays") else {}
 
-        # FMRIprep must wait for a session to be finished before running the next one
-        fmriprep_sub_job_ids = []
-
-        for session in sessions:
-
-            print('\n', subject, ' - ', session, '\n')
-            subjects_sessions.append(f"{subject}_{session}")
-
-            # -------------------------------------------
-            # 0. MRIQC on raw BIDS data
-            # -------------------------------------------
-            if workflow.get("run_mriqc_raw"):
-                print("[MRIQC-RAW] (raw data)")
-                mriqc_raw_job_id = run_mriqc(
-                    config,
-                    subject=subject,
-                    session=session,
-                    data_type="raw"
-                    )
-                mriqc_job_ids.append(mriqc_raw_job_id)
-
-            # -------------------------------------------
-            # 1. FREESURFER
-            # -------------------------------------------
-            if workflow.get("run_freesurfer"):
-                print("[FREESURFER]")
-                freesurfer_job_id = run_freesurfer(
-                    config,
-                    subject=subject,
-                    session=session
-                )
-                freesurfer_job_ids.append(freesurfer_job_id)
-            else:
-                freesurfer_job_id = None
-
-            # -------------------------------------------
-            # 2a. QSIprep
-            # -------------------------------------------
-            if workflow.get("run_qsiprep"):
-                print("[QSIPREP]")
-                qsiprep_job_id = run_qsiprep(
-                    config,
-                    subject=subject,
-                    session=session
-                )
-            else:
-                qsiprep_job_id = None
-            # -------------------------------------------
-            # 2b. QC QSIprep
-            # -------------------------------------------
-            if workflow.get("run_qsiprep_qc"):
-                print("[QSIPREP-QC]")
-                dependencies = [job_id for job_id in [qsiprep_job_id] if job_id is not None]
-                qc_qsiprep_job_id = qc_qsiprep.run(
-                    config,
-                    subject=subject,
-                    session=session,
-                    job_ids=dependencies
-                )
-                qc_qsiprep_job_ids.append(qc_qsiprep_job_id)
-
-            # -------------------------------------------
-            # 3a. QSIrecon
-            # -------------------------------------------
-            if workflow.get("run_qsirecon"):
-                print("[QSIRECON]")
-                dependencies = [job_id for job_id in [freesurfer_job_id, qsiprep_job_id] if job_id is not None]
-                qsirecon_job_id = run_qsirecon(
-                    config,
-                    subject=subject,
-                    session=session,
-                    job_ids=dependencies
-                )
-            else:
-                qsirecon_job_id = None
-            # -------------------------------------------
-            # 3b. QC QSIrecon
-            # -------------------------------------------
-            if workflow.get("run_qsirecon_qc"):
-                print("[QSIRECON-QC]")
-                dependencies = [job_id for job_id in [qsirecon_job_id] if job_id is not None]
-                qc_qsirecon_job_id = qc_qsirecon.run(
-                    config,
-                    subject=subject,
-                    session=session,
-                    job_ids=dependencies
-                )
-                qc_qsirecon_job_ids.append(qc_qsirecon_job_id)
-
-            # -------------------------------------------
-            # 4a fMRIPrep
-            # -------------------------------------------
-            if workflow.get("run_fmriprep"):
-                print("[FMRIPREP]")
-                dependencies = [job_id for job_id in [freesurfer_job_id] + fmriprep_sub_job_ids if job_id is not None]
-                fmriprep_job_id = run_fmriprep(
-                    config,
-                    subject=subject,
-                    session=session,
-                    job_ids=dependencies
-                )
-                fmriprep_sub_job_ids.append(fmriprep_job_id)
-            else:
-                fmriprep_job_id = None
-            # -------------------------------------------
-            # 4b QC fMRIPrep
-            # -------------------------------------------
-            if workflow.get("run_fmriprep_qc"):
-                print("[FMRIPREP-QC]")
-                dependencies = [job_id for job_id in [fmriprep_job_id] if job_id is not None]
-                qc_fmriprep_job_id = run_qc_fmriprep(
-                    config,
-                    subject=subject,
-                    session=session,
-                    job_ids=dependencies
-                )
-            else:
-                qc_fmriprep_job_id = None
-            qc_fmriprep_job_ids.append(qc_fmriprep_job_id)
-
-            # -------------------------------------------
-            # 5a. XCP-D
-            # -------------------------------------------
-            if workflow.get("run_xcp_d"):
-                print("[XCP-D]")
-                dependencies = [job_id for job_id in [fmriprep_job_id] if job_id is not None]
-                xcpd_job_id = run_xcpd(
-                    config,
-                    subject=subject,
-                    session=session,
-                    job_ids=dependencies
-                )
-            else:
-                xcpd_job_id = None
-            # -------------------------------------------
-            # 5b QC XCP-D
-            # -------------------------------------------
-            if workflow.get("run_xcpd_qc"):
-                print("[XCPD-QC]")
-                dependencies = [job_id for job_id in [xcpd_job_id] if job_id is not None]
-                qc_xcpd_job_id = run_qc_xcpd(
-                    config,
-                    subject=subject,
-                    session=session,
-                    job_ids=dependencies
-                )
-            else:
-                qc_xcpd_job_id = None
-            qc_xcpd_job_ids.append(qc_xcpd_job_id)
+    # -------------------------------------------------------
+    # Workflow per subject (subjects are independent, they can be submitted in parallel)
+    # -------------------------------------------------------
+    submit = partial(submit_subject, config, stages=stages, array_job_ids=array_job_ids)
+    with ThreadPoolExecutor(max_workers=common.get("max_parallel_subjects", 1)) as executor:
+        for subject_job_ids in executor.map(submit, inventory.keys(), inventory.values()):
+            for name, ids in subject_job_ids.items():
+                job_ids[name].extend(ids)
 
-        print("\n✅ Workflow submission complete for subject:", subject)
+    # -------------------------------------------------------
+    # Inputs of the group-level steps, checked once
+    # -------------------------------------------------------
+    group_inputs = {
+        "raw": BIDS_DIR,
+        "freesurfer": f"{DERIVATIVES_DIR}/freesurfer/outputs",
+        "qsiprep": f"{DERIVATIVES_DIR}/qsiprep/outputs",
+        "qsirecon": f"{DERIVATIVES_DIR}/qsirecon/outputs",
+        "fmriprep": f"{DERIVATIVES_DIR}/fmriprep/outputs",
+        "xcpd": f"{DERIVATIVES_DIR}/xcpd/outputs",
+    }
+    missing_inputs = set()
+    if workflow.get("run_freesurfer_qc") or workflow.get("run_qc_group"):
+        missing_inputs = {data_type for data_type, path in group_inputs.items() if not os.path.isdir(path)}
 
     # -------------------------------------------
     # 6. QC FREESURFER
     # -------------------------------------------
     if workflow.get("run_freesurfer_qc"):
-        print("[QC-FREESURFER]")
-        dependencies = [job_id for job_id in freesurfer_job_ids if job_id is not None]
-        qc_freesurfer.run(
-            config,
-            job_ids=dependencies
-        )
+        logger.info("[QC-FREESURFER]")
+        if "freesurfer" in missing_inputs:
+            logger.warning("[WARNING] %s does not exist. Skipping.", group_inputs["freesurfer"])
+        else:
+            from anat import qc_freesurfer
+            dependencies = collect_dependencies(job_ids["freesurfer"])
+            qc_freesurfer.run(
+                config,
+                job_ids=dependencies
+            )
 
     # -------------------------------------------------------
     # 7. GROUP-LEVEL QC
     # -------------------------------------------------------
     if workflow.get("run_qc_group"):
-        # # QC group-level for raw data
-        # # -------------------------------------------
-        # print(f"[MRIQC-RAW-GROUP]")
-        # dependencies = [job_id for job_id in mriqc_job_ids if job_id is not None]
-        # run_mriqc_group(
-        #     config,
-        #     data_type="raw",
-        #     input_dir=BIDS_DIR,
-        #     job_ids=dependencies
-        # )
-
         # QC group-level for qsiprep data
         # -------------------------------------------
-        print(f"[QSIPREP-GROUP-QC]")
-        dependencies = [job_id for job_id in qc_qsiprep_job_ids if job_id is not None]
-        qc_qsiprep.run_group_qc(config, job_ids=dependencies)
-        # run_mriqc_group(
-        #     config,
-        #     data_type="qsiprep",
-        #     input_dir=f"{DERIVATIVES_DIR}/qsiprep/outputs",
-        #     job_ids=dependencies
-        # )
-        #
-        # # MRIQC group-level for qsirecon data
-        # # -------------------------------------------
-        # print(f"[MRIQC-QSIRECON-GROUP]")
-        # dependencies = [job_id for job_id in qc_qsirecon_job_ids if job_id is not None]
-        # run_mriqc_group(
-        #     config,
-        #     data_type="qsirecon",
-        #     input_dir=f"{DERIVATIVES_DIR}/qsirecon/outputs",
-        #     job_ids=dependencies
-        # )
-        #
-        # # QC group-level for fmriprep data
-        # # -------------------------------------------
-        # print(f"[MRIQC-FMRIPREP-GROUP]")
-        # dependencies = [job_id for job_id in qc_fmriprep_job_ids if job_id is not None]
-        # run_mriqc_group(
-        #     config,
-        #     data_type="fmriprep",
-        #     input_dir=f"{DERIVATIVES_DIR}/fmriprep/outputs",
-        #     job_ids=dependencies
-        # )
-        #
-        # # MRIQC group-level for xcp_d data
-        # # -------------------------------------------
-        # print(f"[MRIQC-XCPD-GROUP]")
-        # dependencies = [job_id for job_id in qc_xcpd_job_ids if job_id is not None]
-        # run_mriqc_group(
-        #     config,
-        #     data_type="xcp_d",
-        #     input_dir=f"{DERIVATIVES_DIR}/xcp_d/outputs",
-        #     job_ids=dependencies
-        # )
+        logger.info("[QSIPREP-GROUP-QC]")
+        if "qsiprep" in missing_inputs:
+            logger.warning("[WARNING] %s does not exist. Skipping.", group_inputs["qsiprep"])
+        else:
+            from dwi import qc_qsiprep
+            dependencies = collect_dependencies(job_ids["qsiprep_qc"])
+            qc_qsiprep.run_group_qc(config, job_ids=dependencies)
 
+        # MRIQC group-level for the data types listed in the configuration
+        # -------------------------------------------
+        from run_mriqc_group import run_mriqc_group
+        for data_type in config["mriqc"].get("group_data_types", []):
+            logger.info("[MRIQC-%s-GROUP]", data_type.upper())
+            if data_type == "qsiprep":
+                logger.info("MRIQC group run for qsiprep is submitted with the QSIPrep group QC. Skipping.")
+                continue
+            if data_type not in MRIQC_GROUP_STEPS:
+                logger.warning("[WARNING] Unknown data type %s (expected one of %s). Skipping.", data_type, list(MRIQC_GROUP_STEPS))
+                continue
+            dependencies = collect_dependencies(job_ids[MRIQC_GROUP_STEPS[data_type]])
+            if not dependencies and data_type in missing_inputs:
+                logger.warning("[WARNING] %s does not exist. Skipping.", group_inputs[data_type])
+                continue
+            run_mriqc_group(
+                config,
+                data_type=data_type,
+                input_dir=group_inputs[data_type],
+                job_ids=dependencies
+            )
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Submit the neuroimaging workflow jobs to Slurm.")
+    parser.add_argument("--config", help="Path to the configuration file (default: config/config.toml).")
+    parser.add_argument("--quiet", action="store_true", help="Only report warnings and errors.")
+    args = parser.parse_args()
+    main(args.config, quiet=args.quiet)
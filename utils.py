@@ -1,22 +1,124 @@
-import toml
+import copy
 import os
+import getpass
+import json
+import logging
+import mmap
+import shlex
+import shutil
 import subprocess
 import re
+import threading
+import time
+import tomllib
 import numpy as np
-from venv import logger
 from datetime import datetime
 from pathlib import Path
 import nibabel as nib
 import warnings
-warnings.filterwarnings("ignore")
+from bisect import bisect_left
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Directories found missing during this run (see `is_missing_dir`)
+_MISSING_DIRS = set()
+
+# Directories already created during this run (see `makedirs`)
+_DIRS_READY = set()
+
+# Scripts set aside by `submit_job` while a job array is prepared (see `collect_submissions`)
+_COLLECTED_SCRIPTS = None
+
+# Rate limit and retries of the job submissions (see `configure_submission`)
+_SUBMISSION = {"bucket": None, "retries": 0, "backoff": 5}
+
+# sbatch errors worth retrying: overloaded controller or submit limit reached
+_SBATCH_TRANSIENT_ERRORS = ("Socket timed out", "MaxSubmitJob", "temporarily unable", "temporarily unavailable")
+
+# Line printed by sbatch on success, with the job ID: "<id>[;<cluster>]" with --parsable, or the default message
+_SUBMITTED_JOB = re.compile(r"^(?:Submitted batch job )?(\d+)(?:;\S*)?\s*$", re.MULTILINE)
+
+# Short SBATCH options used in the scripts, and their long name
+_SBATCH_SHORT_OPTIONS = {"J": "job-name", "o": "output", "e": "error", "p": "partition", "t": "time"}
+
+# Environment setup shared by the SLURM scripts running a container
+MODULE_EXPORT = (
+    '\nmodule purge\n'
+    'module load userspace/all\n'
+    'module load singularity\n'
+)
+
+# Strings written in the SLURM stdout by each step when it terminates without error
+SUCCESS_STRINGS = {
+    "fmriprep": "fMRIPrep finished successfully",
+    "xcpd": "XCP-D finished successfully",
+    "qsiprep": "QSIPrep finished successfully",
+    "qsirecon": "QSIRecon finished successfully",
+    "mriqc": "MRIQC completed",
+}
+# Same markers as bytes, as searched in the memory-mapped logs
+_SUCCESS_MARKERS = {runtype: string.encode() for runtype, string in SUCCESS_STRINGS.items()}
+# Timestamps written by the SLURM scripts (e.g., 240131-14:02:59)
+_TIMESTAMP = re.compile(r"\d{6}-\d{2}:\d{2}:\d{2}")
+_TIMESTAMP_BYTES = re.compile(_TIMESTAMP.pattern.encode())
 
 
 def load_config(config_file):
-    """Load arguments from a JSON config file."""
-    if not os.path.exists(config_file):
+    """
+    Load arguments from a TOML config file (or a JSON file with the same structure, with a .json suffix).
+
+    The file is parsed again only when it has been modified since the last call. A copy is returned, so the
+    caller can modify the configuration freely.
+    """
+    try:
+        mtime = os.stat(config_file).st_mtime_ns
+    except FileNotFoundError:
         return {}
-    with open(config_file, "r") as f:
-        return toml.load(f)
+    return copy.deepcopy(_parse_config(os.path.realpath(config_file), mtime))
+
+
+@lru_cache(maxsize=8)
+def _parse_config(config_file, mtime):
+    """Parse a TOML (or JSON, by suffix) config file (cached by path and modification time, see `load_config`)."""
+    with open(config_file, "rb") as f:
+        if config_file.endswith(".json"):
+            return json.load(f)
+        return tomllib.load(f)
+
+
+def list_subdirs(directory, prefix):
+    """
+    List the subdirectories of a directory whose name starts with a given prefix.
+
+    Parameters
+    ----------
+    directory : str
+        Path to the directory.
+    prefix : str
+        Name prefix (e.g., "sub-").
+
+    Returns
+    -------
+    tuple
+        Sorted names of the matching subdirectories.
+
+    Notes
+    -----
+    Listings are cached by directory modification time, which changes whenever an entry is added or removed, so
+    an unchanged directory is not listed again.
+    """
+    return _list_subdirs(directory, prefix, os.stat(directory).st_mtime_ns)
+
+
+@lru_cache(maxsize=1024)
+def _list_subdirs(directory, prefix, mtime_ns):
+    # scandir gives the entry type with the listing, no stat per entry
+    with os.scandir(directory) as entries:
+        return tuple(sorted(e.name for e in entries if e.name.startswith(prefix) and e.is_dir()))
 
 
 def get_subjects(input_dir, specified_subjects=None):
@@ -38,8 +140,7 @@ def get_subjects(input_dir, specified_subjects=None):
     if specified_subjects:
         return [f"sub-{sub}" if not sub.startswith("sub-") else sub for sub in specified_subjects]
 
-    return sorted(
-        d for d in os.listdir(input_dir) if d.startswith("sub-") and os.path.isdir(os.path.join(input_dir, d)))
+    return list(list_subdirs(input_dir, "sub-"))
 
 
 def get_sessions(input_dir, subject, specified_sessions=None):
@@ -60,12 +161,10 @@ def get_sessions(input_dir, subject, specified_sessions=None):
     list
         List of sessions.
     """
-    subject_path = os.path.join(input_dir, subject)
     if specified_sessions:
         return [f"ses-{ses}" if not ses.startswith("ses-") else ses for ses in specified_sessions]
 
-    return sorted(
-        d for d in os.listdir(subject_path) if d.startswith("ses-") and os.path.isdir(os.path.join(subject_path, d)))
+    return list(list_subdirs(os.path.join(input_dir, subject), "ses-"))
 
 
 def subject_exists(input_dir, subject):
@@ -81,6 +180,128 @@ def subject_exists(input_dir, subject):
     return (Path(input_dir) / subject).exists()
 
 
+def scan_bids(input_dir, specified_subjects=None, specified_sessions=None):
+    """
+    List the subjects of a BIDS dataset and their sessions, walking the dataset once.
+
+    Parameters
+    ----------
+    input_dir : str
+        Path to the input directory containing the dataset in BIDS format.
+    specified_subjects : list or None
+        List of subjects to process. If None, all subjects in the input directory are retrieved.
+    specified_sessions : list or None
+        List of sessions to process. If None, all sessions of each subject are retrieved.
+        Specified sessions that a subject does not have are reported and left out.
+
+    Returns
+    -------
+    dict
+        Sessions by subject, in subject order. Specified subjects missing from the input directory map to None.
+    """
+    existing = list(list_subdirs(input_dir, "sub-"))
+
+    if specified_subjects:
+        subjects = [f"sub-{sub}" if not sub.startswith("sub-") else sub for sub in specified_subjects]
+    else:
+        subjects = existing
+    existing = set(existing)
+
+    if specified_sessions:
+        specified_sessions = [f"ses-{ses}" if not ses.startswith("ses-") else ses for ses in specified_sessions]
+
+    inventory = {}
+    for subject in subjects:
+        if subject not in existing:
+            inventory[subject] = None
+            continue
+
+        sessions = list(list_subdirs(os.path.join(input_dir, subject), "ses-"))
+        if specified_sessions:
+            for session in set(specified_sessions).difference(sessions):
+                logger.warning("[WARNING] Session %s does not exist for %s. Skipping.", session, subject)
+            sessions = [session for session in specified_sessions if session in sessions]
+        inventory[subject] = sessions
+    return inventory
+
+
+# Imaging data found in a subject directory (see `probe_modalities`)
+Modalities = namedtuple("Modalities", "anat dwi func fmap")
+
+
+# Substring identifying the expected images in each modality folder (any file for field maps)
+_MODALITY_FILES = {"anat": "T1w.nii", "dwi": "dwi.nii", "func": "bold.nii", "fmap": ""}
+
+
+def _has_file(folder, pattern):
+    """Check if a folder directly contains an entry whose name contains `pattern`, stopping at the first one."""
+    try:
+        with os.scandir(folder) as entries:
+            return any(pattern in entry.name for entry in entries)
+    except OSError:
+        return False
+
+
+@lru_cache(maxsize=None)
+def probe_modalities(input_dir, subject):
+    """
+    Look for the imaging data of a subject, in a single walk of its directory (cached for the run).
+
+    Parameters
+    ----------
+    input_dir : str
+        Path to the input directory containing the dataset in BIDS format.
+    subject : str
+        Subject identifier (e.g., "sub-01").
+
+    Returns
+    -------
+    Modalities
+        Whether the subject has a T1w image (anat), a DWI image (dwi), a BOLD image (func) and field maps (fmap),
+        in any session.
+
+    Notes
+    -----
+    Only the BIDS layout is visited: the modality folders of the subject (``<subject>/<modality>``) or of its
+    sessions (``<subject>/ses-*/<modality>``), not the rest of the tree. A modality folder is not listed once that
+    modality has been found, and the walk stops as soon as all the modalities are found.
+    """
+    found = dict.fromkeys(_MODALITY_FILES, False)
+    folders = [os.path.join(input_dir, subject)]
+    while folders and not all(found.values()):
+        try:
+            entries = os.scandir(folders.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name in found:
+                    if not found[entry.name] and entry.is_dir():
+                        found[entry.name] = _has_file(entry.path, _MODALITY_FILES[entry.name])
+                elif entry.name.startswith("ses-") and entry.is_dir():
+                    folders.append(entry.path)
+    return Modalities(**found)
+
+
+def subject_modalities(input_dir, subject):
+    """
+    List the modalities for which a subject has imaging data, from a single walk of its directory.
+
+    Parameters
+    ----------
+    input_dir : str
+        Path to the input directory containing the dataset in BIDS format.
+    subject : str
+        Subject identifier (e.g., "sub-01").
+
+    Returns
+    -------
+    set
+        Modalities found in any session, among "anat", "dwi", "func" and "fmap" (see `probe_modalities`).
+    """
+    return {modality for modality, found in probe_modalities(input_dir, subject)._asdict().items() if found}
+
+
 def has_anat(input_dir, subject):
     """
     Check if the subject has anatomical data.
@@ -90,7 +311,7 @@ def has_anat(input_dir, subject):
     :return: Description
     
     """
-    return any((Path(input_dir) / subject).glob("**/anat/*T1w.nii*"))
+    return probe_modalities(input_dir, subject).anat
 
 
 def has_dwi(input_dir, subject):
@@ -102,7 +323,7 @@ def has_dwi(input_dir, subject):
     :return: Description
     
     """
-    return any((Path(input_dir) / subject).glob("**/dwi/*dwi.nii*"))
+    return probe_modalities(input_dir, subject).dwi
 
 
 def has_func_fmap(input_dir, subject):
@@ -114,8 +335,266 @@ def has_func_fmap(input_dir, subject):
     :return: Description
     
     """
-    return any((Path(input_dir) / subject).glob("**/func/*bold.nii*")) and any(
-        (Path(input_dir) / subject).glob("**/fmap/*"))
+    modalities = probe_modalities(input_dir, subject)
+    return modalities.func and modalities.fmap
+
+
+def is_missing_dir(path):
+    """
+    Check whether a directory does not exist, remembering negative answers for the rest of the run.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory.
+
+    Returns
+    -------
+    bool
+        True if the directory does not exist, False otherwise.
+
+    Notes
+    -----
+    Directories created with `makedirs` are forgotten, so that they are looked up again on the next call.
+    """
+    if path in _MISSING_DIRS:
+        return True
+    if os.path.exists(path):
+        return False
+    _MISSING_DIRS.add(path)
+    return True
+
+
+def makedirs(*paths, mode=None):
+    """
+    Create the given directories (and their parents) if they do not exist.
+
+    Parameters
+    ----------
+    *paths : str
+        Paths to the directories to create.
+    mode : int, optional
+        Permissions to set on the directories (e.g., 0o771 for shared ownership). Directories owned by another
+        user are left as they are.
+
+    Notes
+    -----
+    Created directories are remembered, so that later calls for the same paths do not touch the filesystem.
+    """
+    for path in paths:
+        if path in _DIRS_READY:
+            continue
+        os.makedirs(path, exist_ok=True)
+        if mode is not None:
+            try:
+                os.chmod(path, mode)
+            except PermissionError:
+                pass
+        _DIRS_READY.add(path)
+        _MISSING_DIRS.discard(path)
+
+
+def remove_dir(path):
+    """
+    Remove a directory tree without waiting for the deletion to complete.
+
+    The directory is first moved to a hidden `.trash` folder next to it, which is a single metadata operation on
+    the same filesystem, so the original path is free right away. The moved tree is then deleted in a background
+    thread. If the move fails, the tree is deleted synchronously.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory to remove.
+
+    Notes
+    -----
+    The `.trash` folder is outside the `sub-`/`ses-` names, so a tree being deleted (or left behind by an
+    interrupted deletion) is not listed by `get_subjects` or `get_sessions`. The `.trash` folder itself is removed
+    once the last deletion in it is over, so that tools listing every folder (e.g., FSQC on the FreeSurfer
+    subjects directory) do not find it afterwards.
+    """
+    path = os.path.normpath(path)
+    trash_dir = os.path.join(os.path.dirname(path), ".trash")
+    stale = os.path.join(trash_dir, f"{os.path.basename(path)}.{os.getpid()}.{time.time_ns()}")
+    try:
+        os.makedirs(trash_dir, exist_ok=True)
+        os.rename(path, stale)
+    except OSError:
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    _DIRS_READY.discard(path)
+    # Not a daemon thread: the interpreter waits for the deletion before exiting, so no stale tree is left
+    threading.Thread(target=_empty_trash, args=(stale, trash_dir), name=f"remove {os.path.basename(path)}").start()
+
+
+def _empty_trash(stale, trash_dir):
+    """Delete a tree moved to the trash by `remove_dir`, then the trash folder if no other deletion uses it."""
+    shutil.rmtree(stale, ignore_errors=True)
+    try:
+        os.rmdir(trash_dir)
+    except OSError:
+        # Another tree is still being deleted there, its thread removes the folder
+        pass
+
+
+@lru_cache(maxsize=128)
+def _list_stdout(stdout_dir, mtime_ns):
+    """Return the sorted names of the .out files in a stdout directory, listed again when it changes."""
+    with os.scandir(stdout_dir) as entries:
+        return tuple(sorted(entry.name for entry in entries if entry.name.endswith('.out')))
+
+
+def get_stdout_files(stdout_dir, prefix):
+    """
+    List the SLURM .out files of a stdout directory whose name starts with a given prefix.
+
+    Parameters
+    ----------
+    stdout_dir : str
+        Path to the stdout directory of a workflow step.
+    prefix : str
+        Job name prefix (e.g., "xcpd_sub-01_ses-01").
+
+    Returns
+    -------
+    list
+        Names of the matching .out files.
+    """
+    # New jobs writing their logs update the mtime of the directory, which invalidates the cache
+    names = _list_stdout(stdout_dir, os.stat(stdout_dir).st_mtime_ns)
+    stdout_files = []
+    for name in names[bisect_left(names, prefix):]:
+        if not name.startswith(prefix):
+            break
+        stdout_files.append(name)
+    return stdout_files
+
+
+def log_contains(file_path, marker):
+    """
+    Check whether a log file contains a given string, without reading the whole file in memory.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the log file.
+    marker : bytes or str
+        String to look for (e.g., b"XCP-D finished successfully").
+
+    Returns
+    -------
+    bool
+        True if the marker is found, False otherwise.
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        # Success markers are written at the end of the logs, search backwards
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm.rfind(marker if isinstance(marker, bytes) else marker.encode()) != -1
+
+
+def has_success_log(stdout_dir, prefix, runtype):
+    """
+    Check if the latest SLURM .out file of a job reports a successful run.
+
+    Parameters
+    ----------
+    stdout_dir : str
+        Path to the stdout directory of the workflow step.
+    prefix : str
+        Job name prefix (e.g., "xcpd_sub-01_ses-01").
+    runtype : str
+        Workflow step, key of SUCCESS_STRINGS (e.g., "xcpd").
+
+    Returns
+    -------
+    bool
+        True if a successful run is found, False otherwise.
+    """
+    if is_missing_dir(stdout_dir):
+        return False
+
+    stdout_files = get_stdout_files(stdout_dir, prefix)
+    if not stdout_files:
+        return False
+
+    # Only the latest attempt tells whether the step is done
+    stdout_paths = [os.path.join(stdout_dir, file) for file in stdout_files]
+    latest = max(stdout_paths, key=lambda path: os.stat(path).st_mtime)
+    return log_contains(latest, _SUCCESS_MARKERS[runtype])
+
+
+def is_already_processed(config, runtype, subject, session):
+    """
+    Check if subject_session is already processed successfully by a workflow step.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary.
+    runtype : str
+        Workflow step, also name of its derivatives directory (e.g., "xcpd").
+    subject : str
+        Subject identifier (e.g., "sub-01").
+    session : str
+        Session identifier (e.g., "ses-01").
+
+    Returns
+    -------
+    bool
+        True if outputs exist and the job terminated without error, False otherwise.
+    """
+    DERIVATIVES_DIR = config["common"]["derivatives"]
+
+    output_dir = f"{DERIVATIVES_DIR}/{runtype}/outputs/{subject}/{session}"
+    if not os.path.exists(output_dir):
+        return False
+
+    stdout_dir = f"{DERIVATIVES_DIR}/{runtype}/stdout"
+    return has_success_log(stdout_dir, f"{runtype}_{subject}_{session}", runtype)
+
+
+def write_script(path_to_script, *parts):
+    """
+    Write a SLURM script from its parts in a single system call.
+
+    Parameters
+    ----------
+    path_to_script : str
+        Path where the SLURM script will be saved.
+    *parts : str
+        Blocks of the script (header, module loading, commands...), written in order.
+    """
+    data = ''.join(parts).encode()
+    fd = os.open(path_to_script, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def dependency_directive(job_ids):
+    """
+    Build the SBATCH directive making a job wait for the successful end of other jobs.
+
+    Parameters
+    ----------
+    job_ids : list or None
+        SLURM job IDs to depend on (None entries are ignored).
+
+    Returns
+    -------
+    str
+        '#SBATCH --dependency=afterok:...' line, or an empty string if there is no job to wait for.
+    """
+    job_ids = [str(job_id) for job_id in job_ids or [] if job_id is not None]
+    if not job_ids:
+        return ''
+    return f'#SBATCH --dependency=afterok:{":".join(job_ids)}\n'
 
 
 def submit_job(cmd):
@@ -124,8 +603,9 @@ def submit_job(cmd):
 
     Parameters
     ----------
-    cmd : str
-        The command to submit the SLURM job, typically using `sbatch`.
+    cmd : list of str or str
+        The command to submit the SLURM job, typically using `sbatch`, as an argument list (e.g.,
+        ["sbatch", path_to_script]) or as a string, which is split like a shell would.
 
     Returns
     -------
@@ -134,68 +614,395 @@ def submit_job(cmd):
 
     Notes
     -----
-    - The function executes the `sbatch` command using the `subprocess.run` method.
+    - The function executes the `sbatch` command using the `subprocess.run` method, without going through a shell.
+    - `--parsable` is added to `sbatch` commands, so that sbatch prints only the job ID.
     - It captures the output of the command to extract the job ID.
+    - Submissions are rate limited and retried on transient errors, as set by `configure_submission`.
     - If the command fails or the job ID cannot be extracted, the function returns None.
     - The function prints messages to indicate the success or failure of the job submission.
+    - Within `collect_submissions`, the script is set aside and its index in the future job array is returned.
     """
-    try:
-        # Execute the sbatch command and capture the output
-        result = subprocess.run(cmd, shell=True, check=True, text=True, capture_output=True)
-        output = result.stdout.strip()
-
-        # Parse the output to extract the job ID
-        if output.startswith("Submitted batch job"):
-            job_id = output.split()[-1]
-            print(f"SLURM job successfully submitted: ID {job_id}")
-            return job_id
-        else:
-            print("Unable to retrieve the SLURM job ID.")
+    argv = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+    if os.path.basename(argv[0]) == "sbatch" and "--parsable" not in argv:
+        argv.insert(1, "--parsable")
+    if _COLLECTED_SCRIPTS is not None:
+        _COLLECTED_SCRIPTS.append(argv[-1])
+        return ArrayTask(len(_COLLECTED_SCRIPTS) - 1)
+
+    for attempt in range(_SUBMISSION["retries"] + 1):
+        if _SUBMISSION["bucket"] is not None:
+            _SUBMISSION["bucket"].acquire()
+        try:
+            # Execute the sbatch command and capture the output
+            result = subprocess.run(argv, check=True, text=True, capture_output=True)
+            break
+        except subprocess.CalledProcessError as e:
+            # Retry when the controller is overloaded or the submit limit is reached, with exponential backoff
+            if attempt < _SUBMISSION["retries"] and any(err in (e.stderr or "") for err in _SBATCH_TRANSIENT_ERRORS):
+                delay = _SUBMISSION["backoff"] * 2 ** attempt
+                logger.warning("SLURM job submission failed (%s), retrying in %ss", e.stderr.strip(), delay)
+                time.sleep(delay)
+                continue
+            logger.error("Error while submitting the SLURM job: %s", e)
             return None
-    except subprocess.CalledProcessError as e:
-        # Handle errors during the job submission process
-        print(f"Error while submitting the SLURM job: {e}")
+        except OSError as e:
+            # Handle a missing sbatch executable
+            logger.error("Error while submitting the SLURM job: %s", e)
+            return None
+
+    # Parse the output to extract the job ID (the line may come after site-specific messages)
+    match = _SUBMITTED_JOB.search(result.stdout)
+    if match:
+        job_id = match.group(1)
+        logger.info("SLURM job successfully submitted: ID %s", job_id)
+        return job_id
+    else:
+        logger.warning("Unable to retrieve the SLURM job ID.")
         return None
 
 
+class TokenBucket:
+    """
+    Limit the rate of an action: up to `burst` actions at once, then `rate` actions per second.
+    Shared by the threads submitting the subjects.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting for one to be available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate) - 1
+            self.last = now
+            if self.tokens < 0:
+                time.sleep(-self.tokens / self.rate)
+
+
+def configure_submission(common):
+    """
+    Set the rate limit and the retries of the SLURM job submissions (see `submit_job`).
+
+    Parameters
+    ----------
+    common : dict
+        Common section of the configuration (sbatch_rate, sbatch_burst, sbatch_retries, sbatch_backoff).
+    """
+    rate = common.get("sbatch_rate", 0)
+    _SUBMISSION["bucket"] = TokenBucket(rate, common.get("sbatch_burst", 1)) if rate > 0 else None
+    _SUBMISSION["retries"] = common.get("sbatch_retries", 0)
+    _SUBMISSION["backoff"] = common.get("sbatch_backoff", 5)
+
+
+# Comment of the array scripts listing the job name of each task, read back by `get_queue_snapshot`
+_ARRAY_TASKS_LINE = "# Tasks: "
+
+
+class ArrayTask(int):
+    """Index of a script set aside by `collect_submissions`, in the job array that will run it."""
+
+
+@contextmanager
+def collect_submissions():
+    """
+    Set aside the scripts passed to `submit_job` instead of submitting them, to run them as one job array.
+
+    Yields
+    ------
+    list
+        Paths to the collected scripts, in task order (see `submit_array`).
+    """
+    global _COLLECTED_SCRIPTS
+    _COLLECTED_SCRIPTS = []
+    try:
+        yield _COLLECTED_SCRIPTS
+    finally:
+        _COLLECTED_SCRIPTS = None
+
+
+def _read_sbatch_options(path_to_script):
+    """Return the SBATCH options of a script as (long name, value) pairs."""
+    options = []
+    with open(path_to_script, 'r') as f:
+        for line in f:
+            if not line.startswith('#SBATCH'):
+                continue
+            option = line[len('#SBATCH'):].strip()
+            if option.startswith('--'):
+                key, _, value = option[2:].partition('=')
+            else:
+                key, value = _SBATCH_SHORT_OPTIONS.get(option[1], option[1]), option[2:].strip()
+            options.append((key, value))
+    return options
+
+
+def submit_array(scripts, job_name, throttle=None):
+    """
+    Submit SLURM scripts of the same workflow step as the tasks of one job array.
+
+    Parameters
+    ----------
+    scripts : list
+        Paths to the SLURM scripts, one per task (see `collect_submissions`).
+    job_name : str
+        Name of the array job (e.g., "freesurfer_array").
+    throttle : int, optional
+        Maximum number of tasks running at the same time.
+
+    Returns
+    -------
+    str or None
+        SLURM job ID of the array if the submission is successful, None otherwise.
+
+    Notes
+    -----
+    Resources are taken from the first script. Each task runs its script with bash and writes to the stdout/stderr
+    files the script would have written to as a single job, so completion checks are unchanged.
+    Task i of the array can be waited for with the dependency '<array job ID>_<i>'.
+    """
+    options = [(key, value) for key, value in _read_sbatch_options(scripts[0])
+               if key not in ("job-name", "output", "error", "dependency", "array")]
+
+    task_names, outputs, errors = [], [], []
+    for path_to_script in scripts:
+        task_options = dict(_read_sbatch_options(path_to_script))
+        name = task_options.get("job-name", Path(path_to_script).stem)
+        # As sbatch does: without --output, slurm-%j.out in the submission directory; without --error, stderr goes
+        # to the output file
+        output = task_options.get("output") or os.path.join(os.getcwd(), "slurm-%j.out")
+        error = task_options.get("error") or output
+        for files, path in ((outputs, output), (errors, error)):
+            files.append(path.replace("%x", name).replace("%j", "${SLURM_JOB_ID}"))
+        task_names.append(name)
+
+    stdout_dir = os.path.dirname(outputs[0])
+    array_range = f"0-{len(scripts) - 1}" + (f"%{throttle}" if throttle else "")
+    header = (
+        f'#!/bin/bash\n'
+        f'#SBATCH --job-name={job_name}\n'
+        f'#SBATCH --output={stdout_dir}/{job_name}_%A_%a.out\n'
+        f'#SBATCH --array={array_range}\n'
+    )
+    header += ''.join(f'#SBATCH --{key}={value}\n' if value else f'#SBATCH --{key}\n' for key, value in options)
+
+    tasks = (
+        '\n' + _ARRAY_TASKS_LINE + ' '.join(task_names) + '\n'
+        'scripts=(\n' + ''.join(f'    "{path}"\n' for path in scripts) + ')\n'
+        'outputs=(\n' + ''.join(f'    "{path}"\n' for path in outputs) + ')\n'
+        'errors=(\n' + ''.join(f'    "{path}"\n' for path in errors) + ')\n'
+        '\ni=$SLURM_ARRAY_TASK_ID\n'
+        'if [ "${errors[$i]}" = "${outputs[$i]}" ]; then\n'
+        '    bash "${scripts[$i]}" > "${outputs[$i]}" 2>&1\n'
+        'else\n'
+        '    bash "${scripts[$i]}" > "${outputs[$i]}" 2> "${errors[$i]}"\n'
+        'fi\n'
+    )
+
+    path_to_array_script = os.path.join(
+        os.path.dirname(scripts[0]), f"{job_name}_{datetime.now().strftime('%Y%m%d-%H%M%S')}.slurm")
+    write_script(path_to_array_script, header, tasks)
+    return submit_job(["sbatch", path_to_array_script])
+
+
+@lru_cache(maxsize=None)
+def get_queue_snapshot():
+    """
+    Get the pending and running SLURM jobs of the current user, queried once per run.
+
+    Returns
+    -------
+    dict
+        Job ID by job name (empty if squeue is not available). The tasks of the job arrays submitted by
+        `submit_array` are listed under the name of the job they run (e.g., "freesurfer_sub-01_ses-01"), with
+        their task ID (e.g., "1234_5").
+    """
+    cmd = ["squeue", "-h", "-r", "-u", getpass.getuser(), "-t", "PENDING,RUNNING", "--format=%j|%i|%o"]
+    try:
+        result = subprocess.run(cmd, check=True, text=True, capture_output=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.warning("[SQUEUE] Could not list queued jobs: %s", e)
+        return {}
+
+    snapshot = {}
+    for line in result.stdout.splitlines():
+        fields = line.split("|", 2)
+        if len(fields) != 3:
+            continue
+        job_name, job_id, command = (field.strip() for field in fields)
+        snapshot[job_name] = job_id
+
+        # Array tasks (one line per task with -r) are named after the array: map them back to their job
+        _, _, task = job_id.partition("_")
+        if task.isdigit():
+            task_names = _read_array_tasks(command)
+            if int(task) < len(task_names):
+                snapshot[task_names[int(task)]] = job_id
+    return snapshot
+
+
+@lru_cache(maxsize=None)
+def _read_array_tasks(path_to_array_script):
+    """Return the job names of the tasks of an array script written by `submit_array` (empty if unreadable)."""
+    try:
+        with open(path_to_array_script, 'r') as f:
+            for line in f:
+                if line.startswith(_ARRAY_TASKS_LINE):
+                    return tuple(line[len(_ARRAY_TASKS_LINE):].split())
+    except OSError:
+        pass
+    return ()
+
+
+def get_active_job(job_name):
+    """
+    Get the ID of a pending or running job of the current user.
+
+    Parameters
+    ----------
+    job_name : str
+        SLURM job name (e.g., "xcpd_sub-01_ses-01").
+
+    Returns
+    -------
+    str or None
+        SLURM job ID if such a job is in the queue, None otherwise.
+    """
+    return get_queue_snapshot().get(job_name)
+
+
+def _count_subtree(directory):
+    """Count the directories and files below a directory, with an iterative scandir walk (see `count_tree`)."""
+    n_dirs = n_files = 0
+    stack = [directory]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    n_dirs += 1
+                    if not entry.is_symlink():
+                        stack.append(entry.path)
+                else:
+                    n_files += 1
+    return n_dirs, n_files
+
+
+def count_tree(directory, max_workers=8):
+    """
+    Count the directories and files recursively inside the given directory, in a single traversal.
+
+    Parameters
+    ----------
+    directory : str
+        Path to the directory.
+    max_workers : int, optional
+        Number of threads walking the top-level subdirectories concurrently. Default is 8.
+
+    Returns
+    -------
+    tuple of int
+        Number of directories and number of files (0, 0 if the directory does not exist).
+
+    Notes
+    -----
+    Counted like `os.walk`: symbolic links to directories count as directories but are not followed, any other
+    entry counts as a file, and unreadable directories are skipped.
+    The walk is bound by filesystem latency (especially on shared filesystems) and scandir releases the GIL, so
+    the subdirectories are walked in parallel threads.
+    """
+    n_dirs = n_files = 0
+    subdirs = []
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        return 0, 0
+    with entries:
+        for entry in entries:
+            if entry.is_dir():
+                n_dirs += 1
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+            else:
+                n_files += 1
+
+    if max_workers > 1 and len(subdirs) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(subdirs))) as executor:
+            counts = list(executor.map(_count_subtree, subdirs))
+    else:
+        counts = [_count_subtree(subdir) for subdir in subdirs]
+
+    for sub_dirs, sub_files in counts:
+        n_dirs += sub_dirs
+        n_files += sub_files
+    return n_dirs, n_files
+
+
 def count_dirs(directory):
     """
     Count the number of directories recursively inside the given directory
     """
-    if not os.path.isdir(directory):
-        return 0
-    return sum(len(dirs) for _, dirs, _ in os.walk(directory))
+    return count_tree(directory)[0]
 
 
 def count_files(directory):
     """
     Count the number of files recursively inside the given directory
     """
-    if os.path.isdir(directory):
-        return sum([len(files) for _, _, files in os.walk(directory)])
-    else:
-        return 0
+    return count_tree(directory)[1]
+
+
+def _parse_timestamp(timestamp):
+    """
+    Convert a YYMMDD-HH:MM:SS timestamp (str or bytes) to a datetime, as strptime("%y%m%d-%H:%M:%S") would.
+
+    Raises ValueError for an invalid date or time.
+    """
+    year = int(timestamp[0:2])
+    year += 2000 if year < 69 else 1900
+    return datetime(year, int(timestamp[2:4]), int(timestamp[4:6]),
+                    int(timestamp[7:9]), int(timestamp[10:12]), int(timestamp[13:15]))
 
 
 def extract_runtime(content):
-    # Expression régulière pour capturer les timestamps
-    timestamp_pattern = r"\d{6}-\d{2}:\d{2}:\d{2}"
+    """
+    Compute the time elapsed between the first and the last timestamps of a log.
 
-    # Trouver tous les timestamps dans le fichier
-    timestamps = re.findall(timestamp_pattern, content)
+    Parameters
+    ----------
+    content : str, bytes or mmap.mmap
+        Log content. Bytes-like content is scanned without being decoded.
 
-    if not timestamps:
-        return 0
+    Returns
+    -------
+    float
+        Runtime in hours, 0 if the log contains no timestamp.
+    """
+    pattern = _TIMESTAMP if isinstance(content, str) else _TIMESTAMP_BYTES
 
-    # Convertir les timestamps en objets datetime
-    first_timestamp = datetime.strptime(timestamps[0], "%y%m%d-%H:%M:%S")
-    last_timestamp = datetime.strptime(timestamps[-1], "%y%m%d-%H:%M:%S")
+    first = pattern.search(content)
+    if first is None:
+        return 0
+    # The last timestamp is near the end of the log: look for it in growing windows from the tail
+    last, window, start = first, 4096, len(content)
+    while start > first.end():
+        start = max(first.end(), len(content) - window)
+        for last in pattern.finditer(content, start):
+            pass
+        if last is not first:
+            break
+        window *= 8
 
     # Calculer le runtime
-    runtime = last_timestamp - first_timestamp
-    runtime_hours = runtime.total_seconds() / 3600.0  # Convert in hours
-
-    return runtime_hours
+    runtime = _parse_timestamp(last.group()) - _parse_timestamp(first.group())
+    return runtime.total_seconds() / 3600.0  # Convert in hours
 
 
 def read_log(config, subject, session, runtype):
@@ -211,33 +1018,30 @@ def read_log(config, subject, session, runtype):
         return finished_status, runtime
 
     prefix = f"{runtype}_{subject}_{session}"
-    stdout_files = [f for f in os.listdir(stdout_dir) if (f.startswith(prefix) and f.endswith('.out'))]
+    stdout_files = get_stdout_files(stdout_dir, prefix)
     if not stdout_files:
         return finished_status, runtime
 
-    if runtype == "fmriprep":
-        success_string = "fMRIPrep finished successfully"
-    elif runtype == "xcpd":
-        success_string = "XCP-D finished successfully"
-    elif runtype == "qsiprep":
-        success_string = "QSIPrep finished successfully"
-    elif runtype == "qsirecon":
-        success_string = "QSIRecon finished successfully"
-    elif runtype == "mriqc":
-        success_string = "MRIQC finished successfully"
-    else:
-        success_string = 'finished successfully'
+    success_marker = _SUCCESS_MARKERS.get(runtype, b"finished successfully")
+
+    # Most recent attempts first: the runtime reported is the one of the latest successful run
+    stdout_paths = sorted((os.path.join(stdout_dir, file) for file in stdout_files),
+                          key=lambda path: os.stat(path).st_mtime, reverse=True)
 
-    for file in stdout_files:
-        file_path = os.path.join(stdout_dir, file)
-        with open(file_path, 'r') as f:
-            content = f.read()
-            if success_string in content:
+    for file_path in stdout_paths:
+        # Logs can be very large: scan them memory-mapped, without decoding them
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm.rfind(success_marker) == -1:
+                    continue
                 finished_status = "Success"
                 try:
-                    runtime = extract_runtime(content)
+                    runtime = extract_runtime(mm)
                 except ValueError as e:
-                    print(e)
+                    logger.warning("%s", e)
+                break
 
     return finished_status, runtime
 
@@ -250,14 +1054,7 @@ def is_mriqc_done(config, subject, session, runtype):
     DERIVATIVES_DIR = config["common"]["derivatives"]
     stdout_dir = f"{DERIVATIVES_DIR}/qc/{runtype}/stdout"
     prefix = f"qc_{runtype}_{subject}_{session}"
-    if os.path.exists(stdout_dir):
-        stdout_files = [f for f in os.listdir(stdout_dir) if (f.startswith(prefix) and f.endswith('.out'))]
-        for file in stdout_files:
-            file_path = os.path.join(stdout_dir, file)
-            with open(file_path, 'r') as f:
-                if 'MRIQC completed' in f.read():
-                    return True
-    return False
+    return has_success_log(stdout_dir, prefix, "mriqc")
 
 
 def load_any_image(path: Path) -> np.ndarray:
@@ -277,7 +1074,11 @@ def load_any_image(path: Path) -> np.ndarray:
     if not path.exists():
         raise FileNotFoundError(f"File not found: {path}")
 
-    img = nib.load(str(path))  # type: ignore
+    # Uncompressed images are memory-mapped: voxels are only read when the data is accessed.
+    # nibabel warns about harmless header quirks of the derivatives, which are silenced here only.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        img = nib.load(path, mmap=True)  # type: ignore
 
     if isinstance(img, nib.gifti.gifti.GiftiImage):
         logger.info(f"Detected GIFTI surface file: {path.name}")
@@ -305,51 +1106,99 @@ def dice(a, b):
     float
         Dice similarity coefficient.
     """
-    a = a.astype(bool)
-    b = b.astype(bool)
-    inter = np.logical_and(a, b).sum()
-    s = a.sum() + b.sum()
-    return (2 * inter / s) if s > 0 else np.nan
+    # Non-zero voxels are counted directly, without boolean copies of the masks
+    s = np.count_nonzero(a) + np.count_nonzero(b)
+    if s == 0:
+        return np.nan
+    inter = np.count_nonzero(np.logical_and(a, b))
+    return 2 * inter / s
 
 
-def resample(low_res_image, high_res_image):
-    from scipy.ndimage import zoom
+def resample(low_res_image, high_res_image, order=3):
+    """
+    Resample a 3D image to the shape of another one.
+
+    Parameters
+    ----------
+    low_res_image : np.ndarray
+        Image to resample.
+    high_res_image : np.ndarray
+        Image whose shape is the target.
+    order : int, optional
+        Interpolation order: 0 (nearest neighbour, for masks and labels) or up to 5 (spline). Default is 3.
+
+    Returns
+    -------
+    np.ndarray
+        Resampled image, as `scipy.ndimage.zoom` with mode='nearest' would return it.
+    """
+    target_shape = high_res_image.shape[:3]  # Cible : la résolution de l'image de plus haute résolution
+
+    if order == 0:
+        # Plus proche voisin : un simple gather le long de chaque axe, avec les coordonnées (et l'arrondi) de zoom
+        resampled = low_res_image
+        for axis in range(3):
+            source_size, target_size = low_res_image.shape[axis], target_shape[axis]
+            scale = (source_size - 1) / (target_size - 1) if target_size > 1 else 0
+            indices = np.floor(np.arange(target_size) * scale + 0.5).astype(np.intp)
+            resampled = np.take(resampled, indices, axis=axis)
+        return resampled
 
-    target_shape = high_res_image.shape  # Cible : la résolution de l'image de plus haute résolution
+    from scipy.ndimage import zoom
 
     # Calculer les facteurs de zoom pour chaque dimension
     zoom_factors = [target_shape[i] / low_res_image.shape[i] for i in range(3)]
 
     # Rééchantillonner image1 pour qu'elle ait la même taille que image2
-    return zoom(low_res_image, zoom_factors, mode='nearest')
+    return zoom(low_res_image, zoom_factors, order=order, mode='nearest')
 
 
-def mutual_information(image1, image2, bins=64):
-    # Normaliser les images entre 0 et 1
-    image1 = (image1 - image1.min()) / (image1.max() - image1.min())
-    image2 = (image2 - image2.min()) / (image2.max() - image2.min())
+def _bin_indices(image, bins):
+    """
+    Return the histogram bin of each voxel of an image, with `bins` equal bins between its min and max values.
 
-    # Aplatir les images 3D en 1D
-    flat_image1 = image1.ravel()
-    flat_image2 = image2.ravel()
+    Voxels are assigned to the same bins as `np.histogram(image, bins, range=(min, max))` would (the max value
+    falls in the last bin). Non-finite voxels get the index -1.
+    """
+    low, high = np.nanmin(image), np.nanmax(image)
+    scaled = (image.ravel() - low) / (high - low) if high > low else np.zeros(image.size)
+    finite = np.isfinite(scaled)
+    if not finite.all():
+        scaled[~finite] = -1
+    indices = (scaled * bins).astype(np.intp)
+    np.clip(indices, -1, bins - 1, out=indices)
+
+    # Correct the rounding errors against the bin edges, as np.histogram does
+    edges = np.linspace(0, 1, bins + 1)
+    valid = indices >= 0
+    indices[valid & (scaled < edges[indices])] -= 1
+    indices[valid & (scaled >= edges[indices + 1]) & (indices != bins - 1)] += 1
+    indices[~finite] = -1
+    return indices
 
-    # Calculer l'histogramme conjoint
-    joint_hist, _, _ = np.histogram2d(flat_image1, flat_image2, bins=bins, range=[[0, 1], [0, 1]])
 
-    # Calculer les histogrammes marginaux
-    hist1, _ = np.histogram(flat_image1, bins=bins, range=[0, 1])
-    hist2, _ = np.histogram(flat_image2, bins=bins, range=[0, 1])
+def mutual_information(image1, image2, bins=64):
+    # Répartir les voxels des deux images dans `bins` intervalles entre leurs valeurs min et max
+    indices1 = _bin_indices(image1, bins)
+    indices2 = _bin_indices(image2, bins)
+
+    # Calculer l'histogramme conjoint en un seul passage (les voxels non finis sont ignorés)
+    valid = (indices1 >= 0) & (indices2 >= 0)
+    if not valid.all():
+        indices1, indices2 = indices1[valid], indices2[valid]
+    joint_hist = np.bincount(indices1 * bins + indices2, minlength=bins * bins).reshape(bins, bins)
+    if not joint_hist.any():
+        return 0
 
-    # Normaliser les histogrammes
+    # Normaliser l'histogramme conjoint et en déduire les histogrammes marginaux
     joint_hist = joint_hist / joint_hist.sum()
-    hist1 = hist1 / hist1.sum()
-    hist2 = hist2 / hist2.sum()
+    hist1 = joint_hist.sum(axis=1)
+    hist2 = joint_hist.sum(axis=0)
 
-    # Calculer l'information mutuelle
-    mi = 0
-    for i in range(bins):
-        for j in range(bins):
-            if joint_hist[i, j] > 0 and hist1[i] > 0 and hist2[j] > 0:
-                mi += joint_hist[i, j] * np.log2(joint_hist[i, j] / (hist1[i] * hist2[j]))
+    # Calculer l'information mutuelle sur les histogrammes entiers : les cases vides sont bornées par un epsilon
+    # pour que le log reste fini, et ne contribuent pas puisqu'elles sont multipliées par 0
+    tiny = np.finfo(joint_hist.dtype).tiny
+    outer = np.outer(hist1, hist2)
+    mi = np.sum(joint_hist * (np.log2(np.maximum(joint_hist, tiny)) - np.log2(np.maximum(outer, tiny))))
 
-    return mi
\ No newline at end of file
+    return mi